@@ -0,0 +1,60 @@
+"""
+Đo thông lượng trích xuất nội dung HTML (services.text_extraction.extract_content_from_html):
+chạy tuần tự trong process hiện tại so với chạy qua services.workers.WorkerPool.
+
+Chạy: python -m benchmarks.bench_extraction [thư mục chứa file .html] [số worker]
+Không truyền thư mục thì dùng bộ trang HTML tổng hợp.
+"""
+import asyncio
+import os
+import sys
+import time
+from pathlib import Path
+from typing import List
+from services.text_extraction import extract_content_from_html
+from services.workers import WorkerPool
+
+SYNTHETIC_PAGES = 200
+
+def synthetic_page(i: int) -> str:
+    paragraph = " ".join(f"Câu số {j} của đoạn văn trong trang thử nghiệm {i}, đủ dài để được giữ lại." for j in range(12))
+    nav = "".join(f"<li><a href='/muc/{j}'>Mục {j}</a></li>" for j in range(60))
+    body = "".join(f"<h2>Phần {k}</h2><p>{paragraph}</p><div class='ad'><script>var x={k};</script></div>" for k in range(40))
+    return (f"<html><head><title>Trang {i}</title><style>p{{margin:0}}</style></head><body>"
+            f"<nav><ul>{nav}</ul></nav><article>{body}</article><footer>{nav}</footer></body></html>")
+
+def load_corpus(directory: str) -> List[str]:
+    return [path.read_text(encoding="utf-8", errors="ignore") for path in sorted(Path(directory).glob("**/*.html"))]
+
+async def run_pool(pool: WorkerPool, pages: List[str]) -> List:
+    return await asyncio.gather(*(pool.run(extract_content_from_html, page) for page in pages), return_exceptions=True)
+
+def main():
+    pages = load_corpus(sys.argv[1]) if len(sys.argv) > 1 else [synthetic_page(i) for i in range(SYNTHETIC_PAGES)]
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else (os.cpu_count() or 1)
+    if not pages:
+        print("Không có trang HTML nào")
+        return
+    total_mb = sum(len(page.encode("utf-8")) for page in pages) / 1024 / 1024
+    print(f"{len(pages)} trang, {total_mb:.1f} MB, {workers} worker")
+
+    start = time.perf_counter()
+    for page in pages:
+        extract_content_from_html(page)
+    serial = time.perf_counter() - start
+    print(f"Tuần tự: {len(pages) / serial:.1f} trang/s")
+
+    pool = WorkerPool(max_workers=workers)
+    # Khởi động các process con trước khi đo
+    asyncio.run(run_pool(pool, pages[:workers]))
+    start = time.perf_counter()
+    results = asyncio.run(run_pool(pool, pages))
+    pooled = time.perf_counter() - start
+    pool.shutdown()
+
+    failed = sum(1 for result in results if isinstance(result, Exception))
+    print(f"Process pool: {len(pages) / pooled:.1f} trang/s, {len(pages) / pooled / workers:.1f} trang/s mỗi core"
+          f" (x{serial / pooled:.2f}, {failed} trang lỗi/vượt giới hạn CPU)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""
+So sánh cách chọn ngữ cảnh cũ (vòng lặp json.loads + cosine từng dòng) với
+services.retrieval (một phép nhân ma trận-vector + argpartition).
+
+Chạy: python -m benchmarks.bench_retrieval
+"""
+import json
+import time
+import numpy as np
+from services.retrieval import stack_embeddings, top_k_similar
+
+DIM = 768
+TOP_K = 10
+REPEAT = 20
+
+def cosine_similarity(a: list, b: list) -> float:
+    a = np.array(a)
+    b = np.array(b)
+    return np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b))
+
+def legacy_select(rows, query):
+    history_with_scores = []
+    for row_id, embedding in rows:
+        score = cosine_similarity(query, json.loads(embedding))
+        history_with_scores.append((row_id, score))
+    history_with_scores.sort(key=lambda x: x[1], reverse=True)
+    return [row_id for row_id, _ in history_with_scores[:TOP_K]]
+
+def vectorized_select(rows, query):
+    matrix, positions = stack_embeddings([blob for _, blob in rows])
+    order, _ = top_k_similar(matrix, query, TOP_K)
+    return [rows[positions[i]][0] for i in order]
+
+def timed(func, *args) -> float:
+    func(*args)
+    start = time.perf_counter()
+    for _ in range(REPEAT):
+        func(*args)
+    return (time.perf_counter() - start) / REPEAT * 1000
+
+def main():
+    rng = np.random.default_rng(0)
+    query = rng.standard_normal(DIM).tolist()
+    print(f"{'N':>7} {'cũ (ms)':>12} {'mới (ms)':>12} {'tăng tốc':>10}")
+    for n in (50, 500, 5000, 20000):
+        vectors = rng.standard_normal((n, DIM)).astype(np.float32)
+        normalized = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+        json_rows = [(i, json.dumps(v.tolist())) for i, v in enumerate(vectors)]
+        blob_rows = [(i, v.tobytes()) for i, v in enumerate(normalized)]
+
+        assert legacy_select(json_rows, query) == vectorized_select(blob_rows, query)
+        legacy_ms = timed(legacy_select, json_rows, query)
+        vectorized_ms = timed(vectorized_select, blob_rows, query)
+        print(f"{n:>7} {legacy_ms:>12.2f} {vectorized_ms:>12.3f} {legacy_ms / vectorized_ms:>9.0f}x")
+
+if __name__ == "__main__":
+    main()
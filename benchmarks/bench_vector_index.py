@@ -0,0 +1,46 @@
+"""
+Đo độ trễ tìm kiếm và recall@k của services.vector_index.IVFIndex so với quét toàn bộ.
+
+Chạy: python -m benchmarks.bench_vector_index [số vector]
+"""
+import sys
+import time
+import numpy as np
+from services.vector_index import IVFIndex
+
+DIM = 768
+TOP_K = 10
+QUERIES = 200
+
+def make_data(n: int, rng: np.random.Generator) -> np.ndarray:
+    # Dữ liệu gom cụm giống embedding thật hơn là nhiễu đều
+    centers = rng.standard_normal((max(1, n // 200), DIM)).astype(np.float32)
+    data = centers[rng.integers(0, centers.shape[0], n)] + 0.6 * rng.standard_normal((n, DIM)).astype(np.float32)
+    return data / np.linalg.norm(data, axis=1, keepdims=True)
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    rng = np.random.default_rng(0)
+    data = make_data(n, rng)
+    queries = data[rng.choice(n, QUERIES, replace=False)] + 0.1 * rng.standard_normal((QUERIES, DIM)).astype(np.float32)
+
+    index = IVFIndex(DIM)
+    start = time.perf_counter()
+    index.add(np.arange(n), np.zeros(n, dtype=np.int64), data)
+    index.train()
+    print(f"Dựng index {n} vector, {len(index.lists)} danh sách: {time.perf_counter() - start:.2f}s")
+
+    start = time.perf_counter()
+    exact = [np.argsort(-(data @ (q / np.linalg.norm(q))))[:TOP_K] for q in queries]
+    brute_ms = (time.perf_counter() - start) / QUERIES * 1000
+
+    start = time.perf_counter()
+    approx = [index.search(q, TOP_K) for q in queries]
+    ivf_ms = (time.perf_counter() - start) / QUERIES * 1000
+
+    recall = np.mean([len(set(e.tolist()) & {hit[0] for hit in a}) / TOP_K for e, a in zip(exact, approx)])
+    print(f"Quét toàn bộ: {brute_ms:.2f} ms/truy vấn")
+    print(f"IVF (nprobe={index.nprobe}): {ivf_ms:.2f} ms/truy vấn, recall@{TOP_K} = {recall:.3f}")
+
+if __name__ == "__main__":
+    main()
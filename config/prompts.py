@@ -23,6 +23,41 @@ SEARCH_TRIGGER_PATTERNS = [
     r"help me understand"
 ]
 
+# Câu hỏi cần thông tin mới/thời sự, nên tìm kiếm dù không có từ khóa "tìm kiếm"
+SEARCH_FRESHNESS_PATTERNS = [
+    r"hôm nay",
+    r"hiện nay",
+    r"hiện tại",
+    r"mới nhất",
+    r"gần đây",
+    r"tin tức",
+    r"thời tiết",
+    r"tỷ giá",
+    r"giá (vàng|xăng|bitcoin|cổ phiếu)",
+    r"kết quả (trận|bóng đá|xổ số)",
+    r"\b20[2-9]\d\b",
+    r"\blatest\b",
+    r"\bnews\b",
+    r"\btoday\b",
+    r"\bcurrent(ly)?\b",
+    r"\bprice of\b",
+    r"\bweather\b"
+]
+
+# Tin nhắn không cần tìm kiếm: chào hỏi, cảm ơn, hoặc xử lý nội dung user đã đưa
+NO_SEARCH_PATTERNS = [
+    r"^(xin )?chào\b",
+    r"^(hi|hello|hey)\b",
+    r"^(cảm ơn|cám ơn|thank(s| you))",
+    r"^(ok|oke|okay|được rồi|tuyệt|hay quá)\b",
+    r"bạn là ai",
+    r"who are you",
+    r"^(dịch|viết lại|sửa|tóm tắt|rút gọn|kiểm tra chính tả)\b",
+    r"^(translate|rewrite|fix|summarize|refactor)\b",
+    r"^(hãy )?(viết|sáng tác)\b.*\b(thơ|truyện|bài hát|email|thư)\b",
+    r"```"
+]
+
 NEED_MORE_INFO_PATTERNS = [
     r"tôi không có đủ thông tin",
     r"tôi cần thêm thông tin",
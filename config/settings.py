@@ -10,6 +10,143 @@ ACCESS_TOKEN_EXPIRE_MINUTES = 60
 # API settings
 OLLAMA_API_URL = "http://localhost:11434/api/chat"
 OLLAMA_EMB_URL = "http://localhost:11434/api/embeddings"
+# Endpoint embedding theo lô (nhiều input trong một request)
+OLLAMA_EMBED_BATCH_URL = os.getenv("OLLAMA_EMBED_BATCH_URL", "http://localhost:11434/api/embed")
+
+# Embedding và cache embedding (để trống EMBEDDING_CACHE_PATH để tắt tầng lưu trên đĩa)
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "nomic-embed-text")
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "4096"))
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "./embedding_cache.db")
+# Lưu embedding trong ChatHistory dưới dạng float32 đã chuẩn hóa
+EMBEDDING_NORMALIZE = os.getenv("EMBEDDING_NORMALIZE", "true").lower() == "true"
+
+# Số tin nhắn tối đa trong một conversation được chấm điểm khi chọn ngữ cảnh
+RETRIEVAL_CANDIDATE_LIMIT = int(os.getenv("RETRIEVAL_CANDIDATE_LIMIT", "5000"))
+# Chỉ các tin có điểm liên quan cao nhất này mới được xét để lấp ngân sách
+CONTEXT_RELEVANCE_CANDIDATES = int(os.getenv("CONTEXT_RELEVANCE_CANDIDATES", "200"))
+
+# Ngân sách token cho phần lịch sử hội thoại theo từng model
+MODEL_CONTEXT_BUDGETS = {
+    "4T-S": int(os.getenv("CONTEXT_BUDGET_4T_S", "6000")),
+    "4T-L": int(os.getenv("CONTEXT_BUDGET_4T_L", "12000")),
+}
+DEFAULT_CONTEXT_BUDGET = int(os.getenv("DEFAULT_CONTEXT_BUDGET", "8000"))
+# Số lượt hỏi-đáp gần nhất luôn được giữ trong prompt
+CONTEXT_RECENT_TURNS = int(os.getenv("CONTEXT_RECENT_TURNS", "3"))
+
+# Tóm tắt cuộc trò chuyện chạy nền: khi phần lịch sử chưa tóm tắt vượt ngưỡng token,
+# model nhỏ gộp phần đó vào bản tóm tắt, prompt chỉ gửi bản tóm tắt và các lượt gần nhất
+SUMMARY_MODEL = os.getenv("SUMMARY_MODEL", "4T-S")
+SUMMARY_TRIGGER_TOKENS = int(os.getenv("SUMMARY_TRIGGER_TOKENS", "3000"))
+SUMMARY_BATCH_TOKENS = int(os.getenv("SUMMARY_BATCH_TOKENS", "4000"))
+SUMMARY_MAX_TOKENS = int(os.getenv("SUMMARY_MAX_TOKENS", "600"))
+SUMMARY_SCAN_INTERVAL = float(os.getenv("SUMMARY_SCAN_INTERVAL", "300"))
+
+# Index vector theo user cho bộ nhớ dài hạn xuyên conversation
+VECTOR_INDEX_DIR = os.getenv("VECTOR_INDEX_DIR", "storages/indexes")
+VECTOR_INDEX_NPROBE = int(os.getenv("VECTOR_INDEX_NPROBE", "8"))
+VECTOR_INDEX_MIN_TRAIN = int(os.getenv("VECTOR_INDEX_MIN_TRAIN", "2048"))
+VECTOR_INDEX_MAX_LOADED = int(os.getenv("VECTOR_INDEX_MAX_LOADED", "64"))
+VECTOR_INDEX_SAVE_INTERVAL = float(os.getenv("VECTOR_INDEX_SAVE_INTERVAL", "30"))
+LONG_TERM_MEMORY_TOP_K = int(os.getenv("LONG_TERM_MEMORY_TOP_K", "5"))
+LONG_TERM_MEMORY_MIN_SCORE = float(os.getenv("LONG_TERM_MEMORY_MIN_SCORE", "0.6"))
+
+# Số thread tiktoken dùng khi backfill ChatHistory.token_count
+TOKEN_BACKFILL_THREADS = int(os.getenv("TOKEN_BACKFILL_THREADS", "8"))
+
+# Dịch prompt sang tiếng Anh trước khi embedding: "google" (googletrans, cần mạng),
+# "local" (MarianMT qua transformers, chạy offline) hoặc "none" (dùng model embedding đa ngôn ngữ)
+TRANSLATION_BACKEND = os.getenv("TRANSLATION_BACKEND", "google")
+TRANSLATION_LOCAL_MODEL = os.getenv("TRANSLATION_LOCAL_MODEL", "Helsinki-NLP/opus-mt-vi-en")
+TRANSLATION_WORKERS = int(os.getenv("TRANSLATION_WORKERS", "4"))
+TRANSLATION_CACHE_SIZE = int(os.getenv("TRANSLATION_CACHE_SIZE", "4096"))
+
+# Bố cục prompt: "stable" giữ prefix cố định giữa các lượt để Ollama dùng lại KV cache, "legacy" là cách cũ
+PROMPT_LAYOUT = os.getenv("PROMPT_LAYOUT", "stable")
+# Thời gian Ollama giữ model (và KV cache) trong bộ nhớ sau mỗi request
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+
+# Connection pool dùng chung cho mọi request tới Ollama
+OLLAMA_MAX_CONNECTIONS = int(os.getenv("OLLAMA_MAX_CONNECTIONS", "32"))
+OLLAMA_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("OLLAMA_MAX_KEEPALIVE_CONNECTIONS", "16"))
+OLLAMA_KEEPALIVE_EXPIRY = float(os.getenv("OLLAMA_KEEPALIVE_EXPIRY", "60"))
+
+# Tải trang kết quả tìm kiếm: pool dùng chung cho mọi site và số trang tải đồng thời mỗi lần tìm
+FETCH_MAX_CONNECTIONS = int(os.getenv("FETCH_MAX_CONNECTIONS", "64"))
+FETCH_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("FETCH_MAX_KEEPALIVE_CONNECTIONS", "32"))
+FETCH_KEEPALIVE_EXPIRY = float(os.getenv("FETCH_KEEPALIVE_EXPIRY", "30"))
+FETCH_TIMEOUT = float(os.getenv("FETCH_TIMEOUT", "10"))
+FETCH_USER_AGENT = os.getenv(
+    "FETCH_USER_AGENT",
+    "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0 Safari/537.36"
+)
+# Search provider theo thứ tự ưu tiên ("ddg", "searxng", "local"): provider chưa trả lời sau p90 độ trễ
+# của nó thì gọi thêm provider kế tiếp (hedged request), lỗi/rỗng thì chuyển ngay
+SEARCH_PROVIDER_ORDER = [name.strip() for name in os.getenv("SEARCH_PROVIDERS", "ddg").split(",") if name.strip()]
+SEARXNG_URL = os.getenv("SEARXNG_URL", "http://localhost:8888")
+LOCAL_CORPUS_PATH = os.getenv("LOCAL_CORPUS_PATH", "./storages/corpus.jsonl")
+SEARCH_HEDGE_DEFAULT_DELAY = float(os.getenv("SEARCH_HEDGE_DEFAULT_DELAY", "1.5"))
+SEARCH_HEDGE_MIN_DELAY = float(os.getenv("SEARCH_HEDGE_MIN_DELAY", "0.2"))
+SEARCH_HEDGE_MIN_SAMPLES = int(os.getenv("SEARCH_HEDGE_MIN_SAMPLES", "10"))
+SEARCH_PROVIDER_LATENCY_WINDOW = int(os.getenv("SEARCH_PROVIDER_LATENCY_WINDOW", "100"))
+
+# Ngắt mạch theo domain: chậm hơn DOMAIN_SLOW_SECONDS hoặc lỗi DOMAIN_BREAKER_FAILURES lần liên tiếp
+# thì bỏ qua domain trong DOMAIN_BREAKER_COOLDOWN giây
+DOMAIN_SLOW_SECONDS = float(os.getenv("DOMAIN_SLOW_SECONDS", "5"))
+DOMAIN_BREAKER_FAILURES = int(os.getenv("DOMAIN_BREAKER_FAILURES", "3"))
+DOMAIN_BREAKER_COOLDOWN = float(os.getenv("DOMAIN_BREAKER_COOLDOWN", "600"))
+DOMAIN_HEALTH_MAX_DOMAINS = int(os.getenv("DOMAIN_HEALTH_MAX_DOMAINS", "2000"))
+# Cách tìm kiếm khi chat: "prefetch" (sinh truy vấn và tìm trước khi trả lời) hoặc
+# "tool" (khai báo công cụ web_search, chỉ tìm khi model gọi); request có thể ghi đè qua search_mode
+SEARCH_MODE_DEFAULT = os.getenv("SEARCH_MODE_DEFAULT", "prefetch")
+MODEL_SEARCH_MODES = {
+    "4T-S": os.getenv("SEARCH_MODE_4T_S", SEARCH_MODE_DEFAULT),
+    "4T-L": os.getenv("SEARCH_MODE_4T_L", SEARCH_MODE_DEFAULT),
+}
+# Số lượt gọi công cụ tối đa trong một câu trả lời
+SEARCH_TOOL_MAX_ROUNDS = int(os.getenv("SEARCH_TOOL_MAX_ROUNDS", "2"))
+
+# Gate quyết định có tìm kiếm web hay không; trường hợp chưa rõ ("maybe") xử lý theo
+# SEARCH_GATE_MAYBE_POLICY: "search" (tìm như cũ), "skip" (không tìm) hoặc "classifier" (hỏi model nhỏ)
+SEARCH_GATE_MAYBE_POLICY = os.getenv("SEARCH_GATE_MAYBE_POLICY", "search")
+SEARCH_GATE_CLASSIFIER_MODEL = os.getenv("SEARCH_GATE_CLASSIFIER_MODEL", "4T-S")
+
+# Chỉ đọc tối đa FETCH_MAX_BYTES mỗi trang và chỉ nhận các Content-Type dạng HTML
+FETCH_MAX_BYTES = int(os.getenv("FETCH_MAX_BYTES", str(2 * 1024 * 1024)))
+FETCH_ALLOWED_CONTENT_TYPES = {"text/html", "application/xhtml+xml"}
+SEARCH_FETCH_CONCURRENCY = int(os.getenv("SEARCH_FETCH_CONCURRENCY", "6"))
+# Độ sâu tìm kiếm khi chat: "full" (luôn tải trang đầy đủ) hoặc "adaptive" (trả lời bằng đoạn trích,
+# chỉ chờ trang đầy đủ trong SEARCH_LATENCY_BUDGET giây khi đoạn trích quá ít)
+SEARCH_DEPTH = os.getenv("SEARCH_DEPTH", "adaptive")
+SEARCH_LATENCY_BUDGET = float(os.getenv("SEARCH_LATENCY_BUDGET", "2.5"))
+SEARCH_MIN_SNIPPET_CHARS = int(os.getenv("SEARCH_MIN_SNIPPET_CHARS", "300"))
+
+# Cache tìm kiếm: kết quả theo truy vấn (bộ nhớ, TTL ngắn) và nội dung trang theo URL (SQLite)
+SEARCH_QUERY_CACHE_TTL = float(os.getenv("SEARCH_QUERY_CACHE_TTL", "300"))
+SEARCH_QUERY_CACHE_SIZE = int(os.getenv("SEARCH_QUERY_CACHE_SIZE", "1024"))
+PAGE_CACHE_PATH = os.getenv("PAGE_CACHE_PATH", "./page_cache.db")
+PAGE_CACHE_MAX_BYTES = int(os.getenv("PAGE_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+PAGE_CACHE_FRESH_SECONDS = float(os.getenv("PAGE_CACHE_FRESH_SECONDS", "3600"))
+# Chọn đoạn văn từ trang tìm kiếm: cắt trang thành đoạn ~PASSAGE_MAX_TOKENS token, chấm điểm
+# với embedding của prompt và chỉ đưa vào prompt các đoạn tốt nhất trong SEARCH_CONTEXT_TOKENS
+SEARCH_CONTEXT_TOKENS = int(os.getenv("SEARCH_CONTEXT_TOKENS", "1500"))
+PASSAGE_MAX_TOKENS = int(os.getenv("PASSAGE_MAX_TOKENS", "150"))
+PASSAGE_MAX_PER_PAGE = int(os.getenv("PASSAGE_MAX_PER_PAGE", "40"))
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "64"))
+
+# Tài liệu của user (PDF/text/HTML): cắt thành đoạn ~DOCUMENT_CHUNK_TOKENS token, embedding và lưu vào
+# index vector riêng của user. Khi chat lấy DOCUMENT_TOP_K đoạn có điểm >= DOCUMENT_MIN_SCORE; đoạn tốt nhất
+# đạt DOCUMENT_SKIP_SEARCH_SCORE thì bỏ kết quả tìm web (search vẫn chạy song song, 0 để luôn dùng kết quả web)
+DOCUMENT_MAX_BYTES = int(os.getenv("DOCUMENT_MAX_BYTES", str(20 * 1024 * 1024)))
+DOCUMENT_CHUNK_TOKENS = int(os.getenv("DOCUMENT_CHUNK_TOKENS", "200"))
+DOCUMENT_MAX_CHUNKS = int(os.getenv("DOCUMENT_MAX_CHUNKS", "2000"))
+DOCUMENT_PARSE_CPU_LIMIT = float(os.getenv("DOCUMENT_PARSE_CPU_LIMIT", "60"))
+DOCUMENT_TOP_K = int(os.getenv("DOCUMENT_TOP_K", "4"))
+DOCUMENT_MIN_SCORE = float(os.getenv("DOCUMENT_MIN_SCORE", "0.55"))
+DOCUMENT_SKIP_SEARCH_SCORE = float(os.getenv("DOCUMENT_SKIP_SEARCH_SCORE", "0.75"))
+# Process pool trích xuất nội dung HTML và giới hạn thời gian CPU (giây) cho mỗi trang
+EXTRACTION_WORKERS = int(os.getenv("EXTRACTION_WORKERS", str(os.cpu_count() or 1)))
+EXTRACTION_CPU_LIMIT = float(os.getenv("EXTRACTION_CPU_LIMIT", "5"))
 
 # ComfyUI settings
 COMFYUI_API_URL = "http://127.0.0.1:8188/api/prompt"
@@ -18,6 +155,30 @@ COMFYUI_HISTORY_URL = "http://127.0.0.1:8188/api/history"
 
 API_TIMEOUT = 500
 
+# Timeout (giây) cho từng stage chạy song song trước khi sinh câu trả lời
+STAGE_TIMEOUTS = {
+    "summary": 5,
+    "history": 10,
+    "translation": 5,
+    "prompt_embedding": 30,
+    "original_embedding": 30,
+    "search_gate": 10,
+    "search_query": 60,
+    "search": 40,
+    "search_context": 20,
+    "long_term_memory": 5,
+    "documents": 5,
+}
+
+# Gom chunk stream /chat thành frame: gửi khi đủ STREAM_COALESCE_MAX_BYTES hoặc sau STREAM_COALESCE_WINDOW giây
+# (chunk đầu tiên luôn gửi ngay); STREAM_COALESCE_WINDOW=0 để gửi từng chunk như cũ
+STREAM_COALESCE_WINDOW = float(os.getenv("STREAM_COALESCE_WINDOW", "0.03"))
+STREAM_COALESCE_MAX_BYTES = int(os.getenv("STREAM_COALESCE_MAX_BYTES", "4096"))
+STREAM_COALESCE_QUEUE_SIZE = int(os.getenv("STREAM_COALESCE_QUEUE_SIZE", "1024"))
+
+# Số ký tự đầu câu trả lời được giữ lại để phát hiện LLM cần thêm thông tin
+NEED_MORE_INFO_WINDOW = int(os.getenv("NEED_MORE_INFO_WINDOW", "400"))
+
 # CORS settings
 CORS_SETTINGS = {
     "allow_origins": ["*"],
@@ -1,4 +1,4 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, text
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.orm import declarative_base
 
@@ -7,9 +7,68 @@ engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
+def migrate_embeddings_to_blob(batch_size: int = 500):
+    """Chuyển các embedding JSON cũ trong chat_history sang BLOB float32"""
+    from services.embedding_service import pack_embedding, unpack_embedding
+
+    migrated = 0
+    with engine.begin() as conn:
+        while True:
+            rows = conn.execute(text(
+                "SELECT id, embedding FROM chat_history WHERE typeof(embedding) = 'text' LIMIT :limit"
+            ), {"limit": batch_size}).fetchall()
+            if not rows:
+                break
+            for row_id, raw in rows:
+                try:
+                    blob = pack_embedding(unpack_embedding(raw))
+                except (ValueError, TypeError):
+                    blob = None
+                conn.execute(text("UPDATE chat_history SET embedding = :embedding WHERE id = :id"),
+                             {"embedding": blob, "id": row_id})
+            migrated += len(rows)
+    if migrated:
+        print(f"Đã chuyển {migrated} embedding sang định dạng float32")
+        # Thu hồi dung lượng do chuỗi JSON cũ chiếm
+        with engine.connect() as conn:
+            conn.execution_options(isolation_level="AUTOCOMMIT").execute(text("VACUUM"))
+
+def _column_exists(table: str, column: str) -> bool:
+    with engine.connect() as conn:
+        return any(row[1] == column for row in conn.execute(text(f"PRAGMA table_info({table})")))
+
+def migrate_token_counts(batch_size: int = 1000):
+    """Thêm cột chat_history.token_count và đếm token cho các dòng cũ"""
+    from services.token_service import count_tokens_batch
+    from config.settings import TOKEN_BACKFILL_THREADS
+
+    if not _column_exists("chat_history", "token_count"):
+        with engine.begin() as conn:
+            conn.execute(text("ALTER TABLE chat_history ADD COLUMN token_count INTEGER"))
+
+    backfilled = 0
+    with engine.begin() as conn:
+        while True:
+            rows = conn.execute(text(
+                "SELECT id, content FROM chat_history WHERE token_count IS NULL LIMIT :limit"
+            ), {"limit": batch_size}).fetchall()
+            if not rows:
+                break
+            counts = count_tokens_batch([content for _, content in rows], num_threads=TOKEN_BACKFILL_THREADS)
+            conn.execute(text("UPDATE chat_history SET token_count = :token_count WHERE id = :id"),
+                         [{"token_count": count, "id": row_id} for (row_id, _), count in zip(rows, counts)])
+            backfilled += len(rows)
+    if backfilled:
+        print(f"Đã đếm token cho {backfilled} tin nhắn cũ")
+
+def run_migrations():
+    migrate_embeddings_to_blob()
+    migrate_token_counts()
+
 def init_db():
-    from models.models import User, Plan, Voucher, Subscription, ActivationCode, ChatHistory, DeviceVerification, Conversation
+    from models.models import User, Plan, Voucher, Subscription, ActivationCode, ChatHistory, DeviceVerification, Conversation, ConversationSummary, Document, DocumentChunk
     Base.metadata.create_all(bind=engine)
+    run_migrations()
 
 def get_db():
     db = SessionLocal()
@@ -2,12 +2,29 @@
 import uvicorn
 from fastapi import FastAPI
 from routes import router
+from services.http_client import close_http_clients
+from services.memory_service import flush_memory
+from services.document_service import DOCUMENT_INDEX
+from services.summary_service import CONVERSATION_COMPACTOR
+from services.workers import EXTRACTION_POOL
+from contextlib import asynccontextmanager
 import os
 import subprocess
 from rich.progress import Progress, TextColumn, BarColumn, TimeRemainingColumn
 from pathlib import Path
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    CONVERSATION_COMPACTOR.start()
+    yield
+    await CONVERSATION_COMPACTOR.stop()
+    # Lưu các index vector còn thay đổi và đóng connection pool dùng chung khi tắt server
+    await flush_memory()
+    await DOCUMENT_INDEX.flush()
+    await close_http_clients()
+    EXTRACTION_POOL.shutdown()
+
+app = FastAPI(lifespan=lifespan)
 app.include_router(router)
 
 def clear_cache():
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Boolean, Float, JSON, Text
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Boolean, Float, LargeBinary, Text
 from sqlalchemy.orm import relationship
 from database import Base
 from datetime import datetime
@@ -17,6 +17,7 @@ class User(Base):
     device_verifications = relationship("DeviceVerification", back_populates="user")
     conversations = relationship("Conversation", back_populates="user")
     image_generation_history = relationship("ImageGenerationHistory", back_populates="user")
+    documents = relationship("Document", back_populates="user")
 
 class Subscription(Base):
     __tablename__ = "subscriptions"
@@ -79,6 +80,19 @@ class Conversation(Base):
 
     user = relationship("User", back_populates="conversations")
     chat_history = relationship("ChatHistory", back_populates="conversation")
+    summary = relationship("ConversationSummary", back_populates="conversation", uselist=False,
+                           cascade="all, delete-orphan")
+
+class ConversationSummary(Base):
+    __tablename__ = "conversation_summaries"
+    id = Column(Integer, primary_key=True, index=True)
+    conversation_id = Column(Integer, ForeignKey("conversations.id"), unique=True, index=True)
+    content = Column(Text, nullable=False)
+    covered_until_id = Column(Integer, nullable=False)  # ChatHistory.id lớn nhất đã được tóm tắt
+    token_count = Column(Integer, nullable=True)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    conversation = relationship("Conversation", back_populates="summary")
 
 class ChatHistory(Base):
     __tablename__ = "chat_history"
@@ -88,8 +102,9 @@ class ChatHistory(Base):
     subscription_id = Column(Integer, ForeignKey("subscriptions.id"), nullable=True)
     role = Column(String)
     content = Column(String)
+    token_count = Column(Integer, nullable=True)
     timestamp = Column(DateTime, default=datetime.utcnow)
-    embedding = Column(JSON, nullable=True)
+    embedding = Column(LargeBinary, nullable=True)  # float32 BLOB, xem services/embedding_service.pack_embedding
 
     user = relationship("User", back_populates="chat_history")
     conversation = relationship("Conversation", back_populates="chat_history")
@@ -107,3 +122,28 @@ class ImageGenerationHistory(Base):
 
     user = relationship("User", back_populates="image_generation_history")
     subscription = relationship("Subscription", back_populates="image_generation_history")
+
+class Document(Base):
+    __tablename__ = "documents"
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
+    filename = Column(String, nullable=False)
+    kind = Column(String, nullable=False)  # "pdf" | "text" | "html"
+    size = Column(Integer, nullable=False)  # Số byte của file gốc
+    chunk_count = Column(Integer, default=0)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    user = relationship("User", back_populates="documents")
+    chunks = relationship("DocumentChunk", back_populates="document", cascade="all, delete-orphan")
+
+class DocumentChunk(Base):
+    __tablename__ = "document_chunks"
+    id = Column(Integer, primary_key=True, index=True)
+    document_id = Column(Integer, ForeignKey("documents.id"), index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
+    position = Column(Integer, nullable=False)  # Thứ tự đoạn trong tài liệu
+    content = Column(Text, nullable=False)
+    token_count = Column(Integer, nullable=True)
+    embedding = Column(LargeBinary, nullable=True)  # float32 BLOB, xem services/embedding_service.pack_embedding
+
+    document = relationship("Document", back_populates="chunks")
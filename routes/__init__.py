@@ -3,8 +3,12 @@ from fastapi import APIRouter
 from .chat import router as chat_router
 from .auth import router as auth_router
 from .image import router as image_router
+from .metrics import router as metrics_router
+from .document import router as document_router
 
 router = APIRouter()
 router.include_router(auth_router)
 router.include_router(chat_router)
 router.include_router(image_router)
+router.include_router(metrics_router)
+router.include_router(document_router)
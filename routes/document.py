@@ -0,0 +1,24 @@
+from fastapi import APIRouter, Depends, File, UploadFile
+from sqlalchemy.orm import Session
+from typing import List
+from database import get_db
+from auth.auth import get_current_user
+from schemas.schemas import DocumentResponse
+from services.document_service import upload_document_service, get_documents_service, delete_document_service
+
+router = APIRouter(
+    prefix="/documents",
+    tags=["Documents"]
+)
+
+@router.post("", response_model=DocumentResponse)
+async def upload_document(file: UploadFile = File(...), user=Depends(get_current_user), db: Session = Depends(get_db)):
+    return await upload_document_service(file, user, db)
+
+@router.get("", response_model=List[DocumentResponse])
+async def get_documents(user=Depends(get_current_user), db: Session = Depends(get_db)):
+    return await get_documents_service(user, db)
+
+@router.delete("/{document_id}")
+async def delete_document(document_id: int, user=Depends(get_current_user), db: Session = Depends(get_db)):
+    return await delete_document_service(document_id, user, db)
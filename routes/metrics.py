@@ -0,0 +1,44 @@
+from fastapi import APIRouter
+from services.embedding_service import EMBEDDING_CACHE
+from services.translate_service import TRANSLATION_SERVICE
+from services.search_cache import QUERY_CACHE, PAGE_CACHE
+from services.search_gate import SEARCH_GATE
+from services.domain_health import DOMAIN_HEALTH
+from services.search_providers import SEARCH_PROVIDERS
+from services.stream_service import STREAM_COALESCER
+
+router = APIRouter(
+    prefix="/metrics",
+    tags=["Metrics"]
+)
+
+@router.get("/embedding-cache")
+async def embedding_cache_stats():
+    return EMBEDDING_CACHE.stats()
+
+@router.get("/translation")
+async def translation_stats():
+    return TRANSLATION_SERVICE.stats()
+
+@router.get("/search-cache")
+async def search_cache_stats():
+    return {
+        "queries": QUERY_CACHE.stats(),
+        "pages": PAGE_CACHE.stats()
+    }
+
+@router.get("/search-gate")
+async def search_gate_stats():
+    return SEARCH_GATE.stats()
+
+@router.get("/domains")
+async def domain_health_stats():
+    return DOMAIN_HEALTH.stats()
+
+@router.get("/search-providers")
+async def search_provider_stats():
+    return SEARCH_PROVIDERS.stats()
+
+@router.get("/streams")
+async def stream_stats():
+    return STREAM_COALESCER.stats()
@@ -25,6 +25,7 @@ class ChatRequest(BaseModel):
     prompt: str
     api_key: Optional[str] = None
     conversation_id: Optional[int] = None
+    search_mode: Optional[str] = None  # "prefetch" hoặc "tool", mặc định theo model
 
 class SubscriptionResponse(BaseModel):
     plan_name: str
@@ -59,6 +60,17 @@ class ChatHistoryResponse(BaseModel):
     class Config:
         from_attributes = True
 
+class DocumentResponse(BaseModel):
+    id: int
+    filename: str
+    kind: str
+    size: int
+    chunk_count: int
+    created_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
 class ImageGenRequest(BaseModel):
     prompt: str
     api_key: Optional[str] = None
@@ -1,46 +1,64 @@
 from fastapi import HTTPException, status
 from fastapi.responses import StreamingResponse
 import httpx
-import json
 import re
+import asyncio
 from datetime import datetime
-from database import get_db
+from database import get_db, SessionLocal
 from schemas.schemas import ChatRequest, ChatHistoryResponse, ConversationResponse, ConversationCreate
 from auth.auth import validate_api_key
 from models.models import Subscription, ChatHistory, Conversation
-from config.settings import API_TIMEOUT, DEFAULT_SYSTEM, OLLAMA_API_URL, OLLAMA_EMB_URL
-from services.search_service import search_service
+from config.settings import (
+    DEFAULT_SYSTEM, OLLAMA_API_URL, NEED_MORE_INFO_WINDOW, STAGE_TIMEOUTS, EMBEDDING_NORMALIZE, RETRIEVAL_CANDIDATE_LIMIT,
+    MODEL_CONTEXT_BUDGETS, DEFAULT_CONTEXT_BUDGET, CONTEXT_RECENT_TURNS, CONTEXT_RELEVANCE_CANDIDATES, OLLAMA_KEEP_ALIVE,
+    SEARCH_MODE_DEFAULT, MODEL_SEARCH_MODES, SEARCH_TOOL_MAX_ROUNDS, SEARCH_DEPTH, DOCUMENT_SKIP_SEARCH_SCORE
+)
+from config.prompts import NEED_MORE_INFO_PATTERNS
+from services.search_service import search_service, adaptive_search
+from services.passage_service import build_search_context
+from services.search_gate import SEARCH_GATE
+from services.document_service import retrieve_documents, format_document_context
+from services.tool_service import CHAT_TOOLS, run_tool_calls
+from services.http_client import get_ollama_client
+from services.pipeline import Stage, run_stages
+from services.stream_service import (
+    STREAM_COALESCER, iter_ndjson, add_usage, token_event, error_event, done_event, usage_event
+)
+from services.embedding_service import get_embedding, translate_text, pack_embedding
+from services.retrieval import stack_embeddings, top_k_similar
+from services.context_packer import pack_context
+from services.prompt_builder import build_chat_messages
+from services.token_service import count_tokens
+from services.memory_service import remember_message, remember_message_later, forget_messages, forget_conversation, recall
+from services.summary_service import CONVERSATION_COMPACTOR, get_summary, invalidate_summary
 from sqlalchemy.orm import Session
 from typing import List
-import numpy as np
-import tiktoken
-from googletrans import Translator
 
-ENCODING = tiktoken.encoding_for_model("gpt-3.5-turbo")
-TRANSLATOR = Translator()
+NEED_MORE_INFO_RE = re.compile("|".join(NEED_MORE_INFO_PATTERNS), re.IGNORECASE)
+SEARCH_MODES = ("prefetch", "tool")
 
-def count_tokens(text: str) -> int:
-    return len(ENCODING.encode(text))
-
-async def get_embedding(text: str, client: httpx.AsyncClient, translate: bool = True) -> list:
-    input_text = text
-    if translate:
-        try:
-            input_text = TRANSLATOR.translate(text, src='vi', dest='en').text
-        except Exception as e:
-            print(f"Lỗi dịch văn bản: {str(e)}")
-    payload = {"model": "nomic-embed-text", "prompt": input_text}
+# Các stage chạy trong thread riêng và có thể còn chạy sau khi stage quá thời gian, nên mỗi
+# thread dùng session của mình thay vì session của request (Session không thread-safe)
+def _load_summary(conversation_id: int):
+    db = SessionLocal()
     try:
-        response = await client.post(f"{OLLAMA_EMB_URL}", json=payload)
-        response.raise_for_status()
-        return response.json().get("embedding", [])
-    except httpx.HTTPError as e:
-        raise HTTPException(status_code=500, detail=f"Lỗi tạo embedding: {str(e)}")
-
-def cosine_similarity(a: list, b: list) -> float:
-    a = np.array(a)
-    b = np.array(b)
-    return np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b))
+        summary = get_summary(db, conversation_id)
+        db.expunge_all()
+    finally:
+        db.close()
+    return summary
+
+def _load_recent_history(conversation_id: int, watermark: int) -> List[ChatHistory]:
+    db = SessionLocal()
+    try:
+        rows = db.query(ChatHistory).filter(
+            ChatHistory.conversation_id == conversation_id,
+            ChatHistory.id > watermark
+        ).order_by(ChatHistory.timestamp.desc()).limit(50).all()
+        db.expunge_all()
+    finally:
+        db.close()
+    return rows
 
 async def create_conversation_service(request: ConversationCreate, user, db: Session) -> ConversationResponse:
     conversation = Conversation(
@@ -94,34 +112,14 @@ async def stream_chat_service(request: ChatRequest, user, db: Session) -> Stream
         db.refresh(conversation)
         conversation_id = conversation.id
 
-    history_query = db.query(ChatHistory).filter(
-        ChatHistory.conversation_id == conversation_id
-    ).order_by(ChatHistory.timestamp.desc()).limit(50).all()
-
-    total_tokens = sum(count_tokens(hist.content) for hist in history_query)
-    TOKEN_LIMIT = 32000
-
-    async with httpx.AsyncClient(timeout=API_TIMEOUT) as client:
-        prompt_embedding = await get_embedding(request.prompt, client, translate=True)
-
-    if total_tokens > TOKEN_LIMIT:
-        history_with_scores = []
-        for hist in history_query:
-            if hist.embedding:
-                try:
-                    embedding = json.loads(hist.embedding)
-                    score = cosine_similarity(prompt_embedding, embedding)
-                    history_with_scores.append((hist, score))
-                except:
-                    continue
-        history_with_scores.sort(key=lambda x: x[1], reverse=True)
-        selected_history = [hist for hist, _ in history_with_scores[:10]]
-    else:
-        selected_history = history_query
+    search_mode = request.search_mode or MODEL_SEARCH_MODES.get(request.model, SEARCH_MODE_DEFAULT)
+    if search_mode not in SEARCH_MODES:
+        raise HTTPException(status_code=400, detail=f"search_mode không hợp lệ: {search_mode}")
+    # Chế độ tool: model tự gọi web_search khi cần, không sinh truy vấn trước
+    use_tools = search_mode == "tool"
 
-    current_time = datetime.now().strftime("%H:%M:%S")
+    client = get_ollama_client()
 
-    search_context = ""
     # Tạo search prompt đơn giản hóa
     search_prompt = f"""
     Tạo MỘT câu truy vấn tìm kiếm DUY NHẤT từ yêu cầu sau:
@@ -137,148 +135,323 @@ async def stream_chat_service(request: ChatRequest, user, db: Session) -> Stream
     CHÚ Ý: Chỉ trả về đúng 1 truy vấn ngắn gọn, không thêm bất kỳ nội dung nào khác.
     """
 
-    try:
-        search_query_messages = [{"role": "user", "content": search_prompt}]
-        search_query_payload = {
-            "model": "4T-L",
-            "messages": search_query_messages,
-            "stream": False
-        }
+    async def load_summary():
+        return await asyncio.to_thread(_load_summary, conversation_id)
 
-        async with httpx.AsyncClient(timeout=API_TIMEOUT) as client:
-            print(f"[DEBUG] Generating search query for prompt: {request.prompt}")
-            response = await client.post(OLLAMA_API_URL, json=search_query_payload)
-            if response.status_code == 200:
-                search_query = response.json().get("message", {}).get("content", "").strip()
-                print(f"[DEBUG] Generated search query: {search_query}")
-                search_results = search_service(search_query, max_results=3)
-
-                if search_results:
-                    search_context = "Dưới đây là thông tin liên quan:\n\n"
-                    for idx, result in enumerate(search_results, 1):
-                        title = result.get('title', 'Không có tiêu đề')
-                        url = result.get('link', result.get('href', '#'))
-                        content = result.get('content', '').strip()
-                        if content:
-                            search_context += f"{idx}. {title}\nNguồn: {url}\n{content}...\n\n"
-    except Exception as e:
-        print(f"Lỗi khi tìm kiếm: {str(e)}")
+    async def load_history(summary):
+        # Phần đã được tóm tắt không cần gửi lại nguyên văn
+        watermark = summary.covered_until_id if summary else 0
+        return await asyncio.to_thread(_load_recent_history, conversation_id, watermark)
 
-    # Tạo system prompt với context
-    system_prompt = f"""
-      Bạn là một AI assistant tích hợp với khả năng tìm kiếm thông tin chủ động.
+    async def translate_prompt():
+        return await translate_text(request.prompt)
 
-      Bạn đang hỗ trợ cho user tên: `{user.username}`.
-      Thời điểm hiện tại: `{current_time}`.
+    async def embed_prompt(translation):
+        return await get_embedding(translation, client, translate=False)
 
-      {DEFAULT_SYSTEM}
+    async def embed_original_prompt():
+        return await get_embedding(request.prompt, client, translate=False)
 
-      Dựa trên yêu cầu của user, tôi đã chủ động tìm kiếm và thu thập được thông tin sau:
-      {search_context if search_context else 'Tôi đã tìm kiếm nhưng không tìm thấy thông tin phù hợp với yêu cầu của bạn.'}
+    async def gate_search():
+        if use_tools:
+            return False
+        return await SEARCH_GATE.should_search(request.prompt, client)
 
-      Hãy sử dụng thông tin tôi vừa tìm được để trả lời câu hỏi của user một cách chính xác và đáng tin cậy.
-      Nếu thông tin không đủ, hãy nói rõ những gì chưa tìm thấy và đề xuất hướng tìm kiếm khác.
-    """
-    messages = [{"role": "system", "content": system_prompt}]
-    messages += [{"role": hist.role, "content": hist.content} for hist in selected_history]
-    messages.append({"role": "user", "content": request.prompt})
+    async def generate_search_query(search_gate):
+        if not search_gate:
+            return None
+        search_query_payload = {
+            "model": "4T-L",
+            "messages": [{"role": "user", "content": search_prompt}],
+            "stream": False,
+            "keep_alive": OLLAMA_KEEP_ALIVE
+        }
+        print(f"[DEBUG] Generating search query for prompt: {request.prompt}")
+        response = await client.post(OLLAMA_API_URL, json=search_query_payload)
+        if response.status_code != 200:
+            return None
+        search_query = response.json().get("message", {}).get("content", "").strip()
+        print(f"[DEBUG] Generated search query: {search_query}")
+        return search_query or None
+
+    def documents_answer(documents):
+        return bool(documents) and DOCUMENT_SKIP_SEARCH_SCORE > 0 and documents[0].score >= DOCUMENT_SKIP_SEARCH_SCORE
+
+    async def select_search_context(search, prompt_embedding, documents):
+        if documents_answer(documents):
+            # Tài liệu của user đã trả lời được: bỏ kết quả web, không chấm điểm đoạn văn
+            print(f"[DEBUG] Bỏ qua kết quả tìm kiếm web, tài liệu khớp {documents[0].score:.2f}")
+            return ""
+        return await build_search_context(search, prompt_embedding, client)
+
+    async def recall_memory(original_embedding):
+        return await recall(user_id, original_embedding, exclude_conversation_id=conversation_id)
+
+    async def retrieve_user_documents(original_embedding):
+        return await retrieve_documents(user_id, original_embedding)
+
+    # Trang đầy đủ đang tải nền khi search chỉ trả về đoạn trích (SEARCH_DEPTH="adaptive")
+    full_page_task = None
+
+    async def run_search(search_query):
+        nonlocal full_page_task
+        if not search_query:
+            return []
+        if SEARCH_DEPTH == "adaptive":
+            results, full_page_task = await adaptive_search(search_query, max_results=3)
+            return results
+        return await search_service(search_query, max_results=3)
+
+    # Các stage độc lập chạy song song, search bắt đầu ngay khi có truy vấn
+    stage_results = await run_stages([
+        Stage("summary", load_summary, timeout=STAGE_TIMEOUTS["summary"]),
+        Stage("history", load_history, deps=["summary"], timeout=STAGE_TIMEOUTS["history"], default=[]),
+        Stage("translation", translate_prompt, timeout=STAGE_TIMEOUTS["translation"], default=request.prompt),
+        Stage("prompt_embedding", embed_prompt, deps=["translation"], timeout=STAGE_TIMEOUTS["prompt_embedding"]),
+        Stage("original_embedding", embed_original_prompt, timeout=STAGE_TIMEOUTS["original_embedding"]),
+        Stage("search_gate", gate_search, timeout=STAGE_TIMEOUTS["search_gate"], default=True),
+        Stage("search_query", generate_search_query, deps=["search_gate"], timeout=STAGE_TIMEOUTS["search_query"]),
+        Stage("search", run_search, deps=["search_query"], timeout=STAGE_TIMEOUTS["search"], default=[]),
+        Stage("search_context", select_search_context, deps=["search", "prompt_embedding", "documents"],
+              timeout=STAGE_TIMEOUTS["search_context"]),
+        Stage("long_term_memory", recall_memory, deps=["original_embedding"],
+              timeout=STAGE_TIMEOUTS["long_term_memory"], default=[]),
+        Stage("documents", retrieve_user_documents, deps=["original_embedding"],
+              timeout=STAGE_TIMEOUTS["documents"], default=[]),
+    ])
+
+    summary = stage_results["summary"]
+    history_query = stage_results["history"]
+    prompt_embedding = stage_results["prompt_embedding"]
+    documents = stage_results["documents"]
+    search_results = [] if documents_answer(documents) else stage_results["search"]
+    memory_history = stage_results["long_term_memory"]
+
+    # token_count được lưu khi ghi tin nhắn nên không phải encode lại toàn bộ lịch sử
+    total_tokens = sum(
+        hist.token_count if hist.token_count is not None else count_tokens(hist.content)
+        for hist in history_query
+    )
+    context_budget = MODEL_CONTEXT_BUDGETS.get(request.model, DEFAULT_CONTEXT_BUDGET)
+    summary_text = ""
+    if summary:
+        summary_text = summary.content
+        context_budget -= summary.token_count if summary.token_count is not None else count_tokens(summary_text)
+
+    if total_tokens <= context_budget and len(history_query) < 50:
+        # Cả conversation vừa ngân sách: gửi toàn bộ theo thứ tự thời gian
+        selected_history = sorted(history_query, key=lambda hist: hist.id)
+    else:
+        candidates = db.query(ChatHistory.id, ChatHistory.token_count, ChatHistory.embedding).filter(
+            ChatHistory.conversation_id == conversation_id,
+            ChatHistory.id > (summary.covered_until_id if summary else 0)
+        ).order_by(ChatHistory.id.desc()).limit(RETRIEVAL_CANDIDATE_LIMIT).all()
+
+        # Chấm điểm toàn bộ ứng viên bằng một phép nhân ma trận
+        scores = {}
+        if prompt_embedding:
+            matrix, positions = stack_embeddings([c.embedding for c in candidates], normalize=not EMBEDDING_NORMALIZE)
+            order, top_scores = top_k_similar(matrix, prompt_embedding, CONTEXT_RELEVANCE_CANDIDATES)
+            scores = {candidates[positions[i]].id: float(score) for i, score in zip(order, top_scores)}
+
+        selected_ids = pack_context(
+            [(c.id, c.token_count) for c in candidates],
+            budget=context_budget,
+            recent_messages=CONTEXT_RECENT_TURNS * 2,
+            scores=scores
+        )
+        rows_by_id = {hist.id: hist for hist in db.query(ChatHistory).filter(ChatHistory.id.in_(selected_ids)).all()}
+        selected_history = [rows_by_id[i] for i in selected_ids if i in rows_by_id]
+
+    current_time = datetime.now().strftime("%H:%M:%S")
+
+    search_context = stage_results["search_context"]
+    if search_context is None and search_results:
+        # Chấm điểm đoạn văn lỗi/quá thời gian: chọn đoạn theo thứ tự, không cần embedding
+        search_context = await build_search_context(search_results, None, client)
+
+    memory_context = ""
+    if memory_history:
+        memory_context = "Những điều user đã trao đổi trong các cuộc trò chuyện trước có thể liên quan:\n"
+        for hist in memory_history:
+            speaker = "User" if hist.role == "user" else "4T"
+            memory_context += f"- {speaker}: {hist.content[:500]}\n"
+
+    messages = build_chat_messages(
+        selected_history, request.prompt,
+        username=user.username,
+        current_time=current_time,
+        memory_context=memory_context,
+        search_context=search_context,
+        summary=summary_text,
+        searched=stage_results["search_gate"],
+        tools_enabled=use_tools,
+        document_context=format_document_context(documents)
+    )
 
-    async with httpx.AsyncClient(timeout=API_TIMEOUT) as client:
-        original_prompt_embedding = await get_embedding(request.prompt, client, translate=False)
+    original_prompt_embedding = stage_results["original_embedding"]
     new_user_msg = ChatHistory(
         user_id=user_id,
         conversation_id=conversation_id,
         subscription_id=subscription_id,
         role="user",
         content=request.prompt,
-        embedding=json.dumps(original_prompt_embedding)
+        token_count=count_tokens(request.prompt),
+        embedding=pack_embedding(original_prompt_embedding)
     )
     db.add(new_user_msg)
     db.commit()
+    # Việc tìm bộ nhớ của lượt này không cần chính tin nhắn này: cập nhật index ở nền, không làm chậm token đầu
+    remember_user_msg = remember_message_later(user_id, new_user_msg.id, conversation_id, original_prompt_embedding)
 
     ollama_payload = {
         "model": request.model,
         "messages": messages,
         "stream": True,
+        "keep_alive": OLLAMA_KEEP_ALIVE,
         "options": {
             "temperature": 0.7,
             "num_predict": -1,
             "think": False
         }
     }
+    if use_tools:
+        ollama_payload["tools"] = CHAT_TOOLS
+
+    async def find_additional_context() -> str:
+        try:
+            # Ưu tiên trang đầy đủ của lượt search trước (thường đã tải xong ở nền)
+            results = await full_page_task if full_page_task is not None else []
+            if not results:
+                results = await search_service(request.prompt, max_results=3)
+            return await build_search_context(results, prompt_embedding, client, header="Tôi đã tìm thêm thông tin:")
+        except Exception as e:
+            print(f"Lỗi khi tìm kiếm thông tin bổ sung: {str(e)}")
+            return ""
 
     full_response = ""
     async def stream_generator():
         nonlocal full_response
-        from config.prompts import NEED_MORE_INFO_PATTERNS
-
-        async with httpx.AsyncClient(timeout=API_TIMEOUT) as client:
-            try:
-                test_response = await client.post(OLLAMA_API_URL, json={**ollama_payload, "stream": False})
-                if test_response.status_code != 200:
-                    yield f"data: {{\"error\": \"API Ollama không khả dụng: Status {test_response.status_code}\"}}".encode()
-                    return
-
-                # Kiểm tra xem LLM có cần thêm thông tin không
-                test_content = test_response.json().get("message", {}).get("content", "")
-                needs_more_info = any(re.search(pattern, test_content.lower()) for pattern in NEED_MORE_INFO_PATTERNS)
-
-                if needs_more_info:
-                    # Tìm kiếm thêm thông tin
-                    try:
-                        search_results = search_service(request.prompt, max_results=3)
-                        if search_results:
-                            additional_context = "Tôi đã tìm thêm thông tin:\n\n"
-                            for idx, result in enumerate(search_results, 1):
-                                additional_context += f"{idx}. {result['title']}\n{result['content'][:500]}...\n\n"
-
-                            # Thêm thông tin mới vào messages
-                            messages.append({"role": "system", "content": additional_context})
-                            messages.append({"role": "user", "content": "Bây giờ hãy trả lời câu hỏi của tôi với thông tin bổ sung trên"})
-
-                            # Cập nhật payload với messages mới
-                            ollama_payload["messages"] = messages
-                    except Exception as e:
-                        print(f"Lỗi khi tìm kiếm thông tin bổ sung: {str(e)}")
-
-            except httpx.HTTPError as e:
-                yield f"data: {{\"error\": \"Kiểm tra API Ollama thất bại: {str(e)}\"}}".encode()
-                return
-
+        client = get_ollama_client()
+        # Chỉ kiểm tra phần đầu câu trả lời ở lượt sinh đầu tiên; chế độ tool để model tự gọi tìm kiếm
+        checking = not use_tools
+        # Phần câu trả lời đã gửi cho client trước khi model gọi công cụ
+        answered = ""
+        tool_rounds = 0
+        # Thống kê token cộng dồn qua mọi lượt sinh, gửi trong event usage cuối stream
+        usage = {}
+        done_reason = None
+
+        while True:
+            full_response = answered
+            held_chunks = []
+            needs_more_info = False
+            tool_calls = []
+            stream_error = None
             try:
                 async with client.stream("POST", OLLAMA_API_URL, json=ollama_payload) as response:
+                    if response.status_code == 400 and "tools" in ollama_payload:
+                        # Template của model không hỗ trợ tools: trả lời không có công cụ
+                        print(f"Model {request.model} không hỗ trợ tool calling, bỏ công cụ web_search")
+                        ollama_payload.pop("tools")
+                        continue
                     if response.status_code != 200:
-                        yield f"data: {{\"error\": \"Lỗi API Ollama: Status {response.status_code}\"}}".encode()
-                        return
-                    async for chunk in response.aiter_bytes():
-                        try:
-                            chunk_str = chunk.decode('utf-8')
-                            if "content" in chunk_str:
-                                data = json.loads(chunk_str)
-                                if "message" in data and "content" in data["message"]:
-                                    content_delta = data["message"]["content"]
-                                    full_response += content_delta
-                                    yield chunk
-                        except:
+                        # Thoát vòng sinh, phần đã trả lời ở các lượt trước vẫn được lưu
+                        yield error_event(f"Lỗi API Ollama: Status {response.status_code}")
+                        break
+                    async for data in iter_ndjson(response.aiter_bytes()):
+                        if data.get("error"):
+                            stream_error = f"Lỗi API Ollama: {data['error']}"
+                            break
+                        if data.get("done"):
+                            add_usage(usage, data)
+                            done_reason = data.get("done_reason")
+                        message = data.get("message") or {}
+                        if message.get("tool_calls"):
+                            tool_calls.extend(message["tool_calls"])
+                            continue
+                        content = message.get("content")
+                        if not content:
+                            continue
+                        full_response += content
+                        chunk = token_event(content)
+
+                        if not checking:
                             yield chunk
+                            continue
+
+                        # Giữ lại các chunk đầu cho tới khi đủ cửa sổ kiểm tra
+                        held_chunks.append(chunk)
+                        if NEED_MORE_INFO_RE.search(full_response):
+                            # LLM cần thêm thông tin: chỉ sinh lại khi thật sự tìm được context bổ sung
+                            checking = False
+                            SEARCH_GATE.record_miss(searched=stage_results["search_gate"])
+                            additional_context = await find_additional_context()
+                            if additional_context:
+                                # Thêm thông tin mới vào cuối messages; message system sẽ bị template gom lên đầu prompt
+                                messages.append({"role": "user", "content": f"{additional_context}Bây giờ hãy trả lời câu hỏi của tôi với thông tin bổ sung trên"})
+                                ollama_payload["messages"] = messages
+                                # Thoát khỏi stream sẽ đóng kết nối và dừng việc sinh ở Ollama
+                                needs_more_info = True
+                                break
+                            # Không có gì để bổ sung: trả nốt câu trả lời đang sinh
+                            for held in held_chunks:
+                                yield held
+                            held_chunks = []
+                            continue
+                        if len(full_response) >= NEED_MORE_INFO_WINDOW:
+                            checking = False
+                            for held in held_chunks:
+                                yield held
+                            held_chunks = []
             except httpx.HTTPError as e:
-                yield f"data: {{\"error\": \"Lỗi streaming API Ollama: {str(e)}\"}}".encode()
+                stream_error = f"Lỗi streaming API Ollama: {str(e)}"
+
+            if stream_error:
+                # Vẫn lưu phần câu trả lời đã sinh: gửi nốt các chunk đang giữ, báo lỗi rồi thoát vòng sinh
+                for held in held_chunks:
+                    yield held
+                yield error_event(stream_error)
+                break
+
+            if tool_calls:
+                # Model gọi web_search: chạy tìm kiếm rồi sinh tiếp với kết quả trong cùng stream
+                tool_rounds += 1
+                messages.append({"role": "assistant", "content": full_response[len(answered):], "tool_calls": tool_calls})
+                messages.extend(await run_tool_calls(tool_calls))
+                if tool_rounds >= SEARCH_TOOL_MAX_ROUNDS:
+                    ollama_payload.pop("tools", None)
+                ollama_payload["messages"] = messages
+                answered = full_response
+                continue
+
+            if not needs_more_info:
+                # Stream kết thúc trước khi đủ cửa sổ kiểm tra
+                for held in held_chunks:
+                    yield held
+                yield done_event(done_reason)
+                break
+            # Đã thêm context bổ sung: sinh lại câu trả lời với messages mới
 
         if full_response:
-            async with httpx.AsyncClient(timeout=API_TIMEOUT) as client:
-                response_embedding = await get_embedding(full_response, client, translate=False)
+            response_embedding = await get_embedding(full_response, client, translate=False)
             new_assistant_msg = ChatHistory(
                 user_id=user_id,
                 conversation_id=conversation_id,
                 subscription_id=subscription_id,
                 role="assistant",
                 content=full_response,
-                embedding=json.dumps(response_embedding)
+                token_count=await asyncio.to_thread(count_tokens, full_response),
+                embedding=pack_embedding(response_embedding)
             )
             db.add(new_assistant_msg)
             db.commit()
+            await remember_user_msg
+            await remember_message(user_id, new_assistant_msg.id, conversation_id, response_embedding)
+            CONVERSATION_COMPACTOR.notify(conversation_id)
+        yield usage_event({**usage, "conversation_id": conversation_id})
 
-    return StreamingResponse(stream_generator(), media_type="text/event-stream")
+    return StreamingResponse(STREAM_COALESCER.coalesce(stream_generator()), media_type="text/event-stream")
 
 async def get_conversations_service(user, db: Session) -> List[ConversationResponse]:
     conversations = db.query(Conversation).filter(Conversation.user_id == user.id).all()
@@ -305,6 +478,7 @@ async def delete_conversation_service(conversation_id: int, user, db: Session):
         raise HTTPException(status_code=404, detail="Không tìm thấy conversation")
     db.delete(conversation)
     db.commit()
+    await forget_conversation(user.id, conversation_id)
     return {"msg": "Conversation đã được xóa"}
 
 async def delete_history_service(history_id: int, user, db: Session):
@@ -314,24 +488,28 @@ async def delete_history_service(history_id: int, user, db: Session):
     ).first()
     if not history:
         raise HTTPException(status_code=404, detail="Không tìm thấy tin nhắn")
+    conversation_id = history.conversation_id
     db.delete(history)
     db.commit()
+    await forget_messages(user.id, [history_id])
+    if conversation_id and invalidate_summary(db, conversation_id, history_id):
+        CONVERSATION_COMPACTOR.notify(conversation_id)
     return {"msg": "Tin nhắn đã được xóa"}
 
 async def stream_chat_service_no_auth(request: ChatRequest,  db: Session, temperature: int = 1, num_predict: int = -1,) -> StreamingResponse:
     try:
         current_time = datetime.now().strftime("%H:%M:%S")
-        system_prompt = f"""
-          Thời gian hiện tại là {current_time}.
-          {DEFAULT_SYSTEM}
-        """
-        messages = [{"role": "system", "content": system_prompt}]
-        messages.append({"role": "user", "content": request.prompt})
+        # Thời gian đặt trong tin nhắn user để system prompt giữ nguyên giữa các request
+        messages = [
+            {"role": "system", "content": DEFAULT_SYSTEM},
+            {"role": "user", "content": f"[Thời gian hiện tại là {current_time}]\n\n{request.prompt}"}
+        ]
 
         ollama_payload = {
             "model": request.model,
             "messages": messages,
             "stream": True,
+            "keep_alive": OLLAMA_KEEP_ALIVE,
             "options": {
                 "temperature": temperature,
                 "num_predict": num_predict,
@@ -340,28 +518,33 @@ async def stream_chat_service_no_auth(request: ChatRequest,  db: Session, temper
         }
 
         async def stream_generator():
-            async with httpx.AsyncClient(timeout=API_TIMEOUT) as client:
-                try:
-                    test_response = await client.post(OLLAMA_API_URL, json={**ollama_payload, "stream": False})
-                    if test_response.status_code != 200:
-                        yield f"data: {{\"error\": \"API Ollama không khả dụng: Status {test_response.status_code}\"}}".encode()
+            client = get_ollama_client()
+            usage = {}
+            try:
+                async with client.stream("POST", OLLAMA_API_URL, json=ollama_payload) as response:
+                    if response.status_code != 200:
+                        yield error_event(f"Lỗi API Ollama: Status {response.status_code}")
                         return
-                except httpx.HTTPError as e:
-                    yield f"data: {{\"error\": \"Kiểm tra API Ollama thất bại: {str(e)}\"}}".encode()
-                    return
-
-                try:
-                    async with client.stream("POST", OLLAMA_API_URL, json=ollama_payload) as response:
-                        if response.status_code != 200:
-                            yield f"data: {{\"error\": \"Lỗi API Ollama: Status {response.status_code}\"}}".encode()
-                            return
-                        async for chunk in response.aiter_bytes():
-                            try:
-                                yield chunk
-                            except:
-                                yield chunk
-                except httpx.HTTPError as e:
-                    yield f"data: {{\"error\": \"Lỗi streaming API Ollama: {str(e)}\"}}".encode()
+                    done_reason = None
+                    stream_error = None
+                    async for data in iter_ndjson(response.aiter_bytes()):
+                        if data.get("error"):
+                            stream_error = f"Lỗi API Ollama: {data['error']}"
+                            break
+                        content = (data.get("message") or {}).get("content")
+                        if content:
+                            yield token_event(content)
+                        if data.get("done"):
+                            add_usage(usage, data)
+                            done_reason = data.get("done_reason")
+                    if stream_error:
+                        yield error_event(stream_error)
+                    else:
+                        yield done_event(done_reason)
+            except httpx.HTTPError as e:
+                yield error_event(f"Lỗi streaming API Ollama: {str(e)}")
+            # Lỗi giữa chừng vẫn gửi thống kê của phần đã sinh
+            yield usage_event(usage)
 
         return StreamingResponse(stream_generator(), media_type="text/event-stream")
     except Exception as e:
@@ -375,9 +558,12 @@ async def edit_history_service(history_id: int, content: str, user, db: Session)
     ).first()
     if not history:
         raise HTTPException(status_code=404, detail="Không tìm thấy tin nhắn hoặc không được phép sửa")
-    async with httpx.AsyncClient(timeout=API_TIMEOUT) as client:
-        new_embedding = await get_embedding(content, client, translate=False)
+    new_embedding = await get_embedding(content, get_ollama_client(), translate=False)
     history.content = content
-    history.embedding = json.dumps(new_embedding)
+    history.token_count = count_tokens(content)
+    history.embedding = pack_embedding(new_embedding)
     db.commit()
+    await remember_message(user.id, history.id, history.conversation_id, new_embedding)
+    if history.conversation_id and invalidate_summary(db, history.conversation_id, history.id):
+        CONVERSATION_COMPACTOR.notify(history.conversation_id)
     return {"msg": "Tin nhắn đã được sửa"}
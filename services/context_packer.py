@@ -0,0 +1,39 @@
+from typing import Dict, List, Sequence, Tuple
+
+def pack_context(candidates: Sequence[Tuple[int, int]], budget: int, recent_messages: int,
+                 scores: Dict[int, float] = None) -> List[int]:
+    """
+    Chọn tin nhắn lịch sử đưa vào prompt trong giới hạn token.
+
+    Luôn giữ recent_messages tin nhắn mới nhất, sau đó lấp phần ngân sách còn lại
+    bằng các tin nhắn cũ hơn có điểm liên quan cao nhất (không có điểm thì lấy theo
+    độ mới). Tin nhắn không vừa phần còn lại bị bỏ qua để nhường chỗ cho tin ngắn hơn.
+
+    Args:
+        candidates: Danh sách (id, số token), id tăng dần theo thời gian
+        budget: Tổng số token tối đa cho phần lịch sử
+        recent_messages: Số tin nhắn mới nhất luôn được giữ
+        scores: id -> điểm liên quan với prompt hiện tại
+
+    Returns:
+        Các id được chọn, theo thứ tự thời gian
+    """
+    scores = scores or {}
+    ordered = sorted(candidates, key=lambda c: c[0])
+    split = max(0, len(ordered) - recent_messages)
+    recent, older = ordered[split:], ordered[:split]
+
+    selected = [item_id for item_id, _ in recent]
+    remaining = budget - sum(tokens or 0 for _, tokens in recent)
+
+    # Tin có điểm trước (điểm cao trước), tin không có điểm xếp sau theo độ mới
+    older = sorted(older, key=lambda c: (c[0] in scores, scores.get(c[0], 0.0), c[0]), reverse=True)
+    for item_id, tokens in older:
+        if remaining <= 0:
+            break
+        tokens = tokens or 0
+        if tokens <= remaining:
+            selected.append(item_id)
+            remaining -= tokens
+
+    return sorted(selected)
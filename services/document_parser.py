@@ -0,0 +1,54 @@
+import io
+import os
+from typing import Iterator, List, Optional
+from services.text_extraction import extract_content_from_html, split_passages
+from config.settings import DOCUMENT_CHUNK_TOKENS, DOCUMENT_MAX_CHUNKS
+
+# Tách riêng khỏi document_service; cùng text_extraction, process con trong pool không phải
+# import database hay tầng service
+
+DOCUMENT_KINDS = {
+    ".pdf": "pdf",
+    ".txt": "text",
+    ".md": "text",
+    ".html": "html",
+    ".htm": "html",
+}
+_CONTENT_TYPE_KINDS = {
+    "application/pdf": "pdf",
+    "text/plain": "text",
+    "text/markdown": "text",
+    "text/html": "html",
+}
+
+def document_kind(filename: str, content_type: Optional[str]) -> Optional[str]:
+    kind = DOCUMENT_KINDS.get(os.path.splitext(filename or "")[1].lower())
+    if kind is None and content_type:
+        kind = _CONTENT_TYPE_KINDS.get(content_type.split(";")[0].strip().lower())
+    return kind
+
+def _iter_sections(data: bytes, kind: str) -> Iterator[str]:
+    """Văn bản của tài liệu theo từng phần (mỗi trang PDF một phần) để cắt đoạn dần"""
+    if kind == "pdf":
+        from PyPDF2 import PdfReader
+        for page in PdfReader(io.BytesIO(data)).pages:
+            yield page.extract_text() or ""
+    elif kind == "html":
+        yield extract_content_from_html(data.decode("utf-8", errors="replace")) or ""
+    else:
+        yield data.decode("utf-8", errors="replace")
+
+def parse_document(data: bytes, kind: str, chunk_tokens: int = DOCUMENT_CHUNK_TOKENS,
+                   max_chunks: int = DOCUMENT_MAX_CHUNKS) -> List[str]:
+    """
+    Cắt tài liệu thành các đoạn ~chunk_tokens token; chạy trong process pool.
+
+    PDF được đọc và cắt từng trang, dừng khi đủ max_chunks đoạn nên không phải
+    trích xuất hết một file lớn.
+    """
+    chunks: List[str] = []
+    for section in _iter_sections(data, kind):
+        chunks.extend(split_passages(section, chunk_tokens, max_chunks - len(chunks)))
+        if len(chunks) >= max_chunks:
+            break
+    return chunks
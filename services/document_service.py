@@ -0,0 +1,171 @@
+import asyncio
+from typing import List, NamedTuple, Sequence
+import numpy as np
+from fastapi import HTTPException, UploadFile
+from sqlalchemy.orm import Session
+from database import SessionLocal
+from models.models import Document, DocumentChunk
+from schemas.schemas import DocumentResponse
+from services.embedding_service import get_embeddings_batch, pack_embedding
+from services.http_client import get_ollama_client
+from services.document_parser import document_kind, parse_document
+from services.retrieval import stack_embeddings
+from services.token_service import count_tokens_batch
+from services.vector_index import VectorIndexRegistry
+from services.workers import EXTRACTION_POOL
+from config.settings import (
+    DOCUMENT_MAX_BYTES, DOCUMENT_PARSE_CPU_LIMIT,
+    DOCUMENT_TOP_K, DOCUMENT_MIN_SCORE, EMBEDDING_BATCH_SIZE,
+    VECTOR_INDEX_DIR, VECTOR_INDEX_NPROBE, VECTOR_INDEX_MIN_TRAIN, VECTOR_INDEX_MAX_LOADED, VECTOR_INDEX_SAVE_INTERVAL
+)
+
+_READ_CHUNK = 1024 * 1024
+
+def _document_chunk_filter(query, user_id: int):
+    return query.filter(DocumentChunk.user_id == user_id, DocumentChunk.embedding.isnot(None))
+
+def _load_document_vectors(user_id: int):
+    db = SessionLocal()
+    try:
+        rows = _document_chunk_filter(
+            db.query(DocumentChunk.id, DocumentChunk.document_id, DocumentChunk.embedding), user_id
+        ).all()
+    finally:
+        db.close()
+    matrix, positions = stack_embeddings([row.embedding for row in rows])
+    ids = [rows[i].id for i in positions]
+    tags = [rows[i].document_id for i in positions]
+    return ids, tags, matrix
+
+def _count_document_vectors(user_id: int) -> int:
+    db = SessionLocal()
+    try:
+        return _document_chunk_filter(db.query(DocumentChunk.id), user_id).count()
+    finally:
+        db.close()
+
+# Index tài liệu: mỗi user một index trên DocumentChunk.embedding, tag là document_id
+DOCUMENT_INDEX = VectorIndexRegistry(
+    namespace="documents",
+    directory=VECTOR_INDEX_DIR,
+    loader=_load_document_vectors,
+    counter=_count_document_vectors,
+    nprobe=VECTOR_INDEX_NPROBE,
+    min_train=VECTOR_INDEX_MIN_TRAIN,
+    max_loaded=VECTOR_INDEX_MAX_LOADED,
+    save_interval=VECTOR_INDEX_SAVE_INTERVAL
+)
+
+async def _read_upload(file: UploadFile, max_bytes: int) -> bytes:
+    parts, size = [], 0
+    while True:
+        part = await file.read(_READ_CHUNK)
+        if not part:
+            break
+        size += len(part)
+        if size > max_bytes:
+            raise HTTPException(status_code=413, detail=f"Tài liệu vượt quá {max_bytes // (1024 * 1024)} MB")
+        parts.append(part)
+    return b"".join(parts)
+
+async def upload_document_service(file: UploadFile, user, db: Session) -> DocumentResponse:
+    kind = document_kind(file.filename, file.content_type)
+    if kind is None:
+        raise HTTPException(status_code=400, detail="Chỉ hỗ trợ tài liệu PDF, text, Markdown hoặc HTML")
+    data = await _read_upload(file, DOCUMENT_MAX_BYTES)
+
+    try:
+        chunks = await EXTRACTION_POOL.run(parse_document, data, kind, cpu_limit=DOCUMENT_PARSE_CPU_LIMIT)
+    except Exception as e:
+        print(f"Lỗi đọc tài liệu {file.filename}: {str(e)}")
+        raise HTTPException(status_code=422, detail="Không đọc được nội dung tài liệu")
+    if not chunks:
+        raise HTTPException(status_code=422, detail="Tài liệu không có nội dung văn bản")
+
+    embeddings = await get_embeddings_batch(chunks, get_ollama_client(), EMBEDDING_BATCH_SIZE)
+    token_counts = await asyncio.to_thread(count_tokens_batch, chunks)
+
+    document = Document(user_id=user.id, filename=file.filename, kind=kind, size=len(data), chunk_count=len(chunks))
+    document.chunks = [
+        DocumentChunk(
+            user_id=user.id,
+            position=position,
+            content=content,
+            token_count=tokens,
+            embedding=pack_embedding(embedding) if embedding is not None else None
+        )
+        for position, (content, tokens, embedding) in enumerate(zip(chunks, token_counts, embeddings))
+    ]
+    db.add(document)
+    db.commit()
+    db.refresh(document)
+
+    indexed = [(chunk.id, embedding) for chunk, embedding in zip(document.chunks, embeddings) if embedding is not None]
+    if len(indexed) < len(chunks):
+        print(f"Tài liệu {document.id}: {len(chunks) - len(indexed)} đoạn không tạo được embedding")
+    if indexed:
+        try:
+            await DOCUMENT_INDEX.add(
+                user.id, [chunk_id for chunk_id, _ in indexed], [document.id] * len(indexed),
+                np.stack([embedding for _, embedding in indexed])
+            )
+        except Exception as e:
+            print(f"Lỗi cập nhật index tài liệu: {str(e)}")
+    return document
+
+async def get_documents_service(user, db: Session) -> List[DocumentResponse]:
+    documents = db.query(Document).filter(Document.user_id == user.id).order_by(Document.created_at.desc()).all()
+    return documents
+
+async def delete_document_service(document_id: int, user, db: Session):
+    document = db.query(Document).filter(
+        Document.id == document_id,
+        Document.user_id == user.id
+    ).first()
+    if not document:
+        raise HTTPException(status_code=404, detail="Không tìm thấy tài liệu")
+    db.delete(document)
+    db.commit()
+    try:
+        await DOCUMENT_INDEX.remove_tag(user.id, document_id)
+    except Exception as e:
+        print(f"Lỗi xóa tài liệu khỏi index: {str(e)}")
+    return {"msg": "Tài liệu đã được xóa"}
+
+class DocumentHit(NamedTuple):
+    filename: str
+    position: int
+    content: str
+    score: float
+
+def _load_hits(hits: Sequence) -> List[DocumentHit]:
+    db = SessionLocal()
+    try:
+        rows = db.query(DocumentChunk.id, DocumentChunk.position, DocumentChunk.content, Document.filename).join(
+            Document, Document.id == DocumentChunk.document_id
+        ).filter(DocumentChunk.id.in_([hit_id for hit_id, _, _ in hits])).all()
+    finally:
+        db.close()
+    rows_by_id = {row.id: row for row in rows}
+    return [
+        DocumentHit(rows_by_id[hit_id].filename, rows_by_id[hit_id].position, rows_by_id[hit_id].content, score)
+        for hit_id, _, score in hits if hit_id in rows_by_id
+    ]
+
+async def retrieve_documents(user_id: int, embedding, k: int = DOCUMENT_TOP_K,
+                             min_score: float = DOCUMENT_MIN_SCORE) -> List[DocumentHit]:
+    """Các đoạn tài liệu của user liên quan nhất với embedding, theo điểm giảm dần"""
+    if embedding is None or len(embedding) == 0:
+        return []
+    hits = [hit for hit in await DOCUMENT_INDEX.search(user_id, embedding, k) if hit[2] >= min_score]
+    if not hits:
+        return []
+    return await asyncio.to_thread(_load_hits, hits)
+
+def format_document_context(hits: Sequence[DocumentHit]) -> str:
+    if not hits:
+        return ""
+    context = "Thông tin từ tài liệu user đã tải lên:\n\n"
+    for idx, hit in enumerate(hits, 1):
+        context += f"{idx}. {hit.filename} (đoạn {hit.position + 1})\n{hit.content}\n\n"
+    return context
@@ -0,0 +1,109 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+from urllib.parse import urlparse
+from config.settings import (
+    DOMAIN_SLOW_SECONDS, DOMAIN_BREAKER_FAILURES, DOMAIN_BREAKER_COOLDOWN, DOMAIN_HEALTH_MAX_DOMAINS
+)
+
+def domain_of(url: str) -> str:
+    try:
+        return urlparse(url).netloc.lower()
+    except ValueError:
+        return ""
+
+class DomainStats:
+    def __init__(self):
+        self.requests = 0
+        self.failures = 0
+        self.slow = 0
+        self.skipped = 0
+        # Số lần lỗi/chậm liên tiếp, reset khi có một lần tải tốt
+        self.strikes = 0
+        self.latency_ewma: Optional[float] = None
+        self.open_until = 0.0
+
+class DomainHealth:
+    """
+    Blocklist động đo được theo domain, bổ sung cho danh sách cố định trong is_valid_url.
+
+    Mỗi lần tải trang ghi lại độ trễ và kết quả. Domain lỗi hoặc chậm hơn
+    DOMAIN_SLOW_SECONDS liên tiếp DOMAIN_BREAKER_FAILURES lần thì bị bỏ qua trong
+    DOMAIN_BREAKER_COOLDOWN giây. Hết thời gian đó domain được thử lại; lần thử lại
+    vẫn lỗi/chậm thì bị bỏ qua tiếp ngay, không cần đủ số lần như ban đầu.
+    """
+    def __init__(self, slow_seconds: float = DOMAIN_SLOW_SECONDS, max_strikes: int = DOMAIN_BREAKER_FAILURES,
+                 cooldown: float = DOMAIN_BREAKER_COOLDOWN, max_domains: int = DOMAIN_HEALTH_MAX_DOMAINS):
+        self.slow_seconds = slow_seconds
+        self.max_strikes = max_strikes
+        self.cooldown = cooldown
+        self.max_domains = max_domains
+        self._lock = threading.Lock()
+        self._domains: "OrderedDict[str, DomainStats]" = OrderedDict()
+        self.trips = 0
+
+    def _stats(self, domain: str) -> DomainStats:
+        stats = self._domains.get(domain)
+        if stats is None:
+            stats = self._domains[domain] = DomainStats()
+            while len(self._domains) > self.max_domains:
+                self._domains.popitem(last=False)
+        self._domains.move_to_end(domain)
+        return stats
+
+    def allow(self, url: str) -> bool:
+        """False nếu domain đang bị ngắt mạch"""
+        domain = domain_of(url)
+        with self._lock:
+            stats = self._domains.get(domain)
+            if stats is None or stats.open_until <= time.monotonic():
+                return True
+            stats.skipped += 1
+            return False
+
+    def record(self, url: str, latency: float, ok: bool) -> None:
+        domain = domain_of(url)
+        if not domain:
+            return
+        with self._lock:
+            stats = self._stats(domain)
+            stats.requests += 1
+            stats.latency_ewma = latency if stats.latency_ewma is None else 0.8 * stats.latency_ewma + 0.2 * latency
+            slow = latency > self.slow_seconds
+            if not ok:
+                stats.failures += 1
+            if slow:
+                stats.slow += 1
+            if ok and not slow:
+                stats.strikes = 0
+                return
+            stats.strikes += 1
+            if stats.strikes >= self.max_strikes:
+                if stats.open_until <= time.monotonic():
+                    self.trips += 1
+                    print(f"Tạm bỏ qua domain {domain} trong {self.cooldown:.0f}s "
+                          f"({stats.strikes} lần lỗi/chậm liên tiếp)")
+                stats.open_until = time.monotonic() + self.cooldown
+
+    def stats(self) -> Dict:
+        now = time.monotonic()
+        with self._lock:
+            domains = {
+                domain: {
+                    "requests": s.requests,
+                    "failures": s.failures,
+                    "slow": s.slow,
+                    "skipped": s.skipped,
+                    "latency_ewma": round(s.latency_ewma, 3) if s.latency_ewma is not None else None,
+                    "open_for": round(s.open_until - now, 1) if s.open_until > now else 0,
+                }
+                for domain, s in self._domains.items()
+            }
+        return {
+            "trips": self.trips,
+            "open": sorted(d for d, s in domains.items() if s["open_for"]),
+            "domains": domains,
+        }
+
+DOMAIN_HEALTH = DomainHealth()
@@ -0,0 +1,286 @@
+from fastapi import HTTPException
+import httpx
+import asyncio
+import hashlib
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+import json
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+import numpy as np
+from config.settings import (
+    OLLAMA_EMB_URL, OLLAMA_EMBED_BATCH_URL, EMBEDDING_BATCH_SIZE, EMBEDDING_MODEL, EMBEDDING_CACHE_SIZE, EMBEDDING_CACHE_PATH, EMBEDDING_NORMALIZE,
+    OLLAMA_KEEP_ALIVE
+)
+from services.translate_service import translate_to_english
+
+def normalize_text(text: str) -> str:
+    """Chuẩn hóa unicode và khoảng trắng để cùng một nội dung cho cùng một khóa cache"""
+    return " ".join(unicodedata.normalize("NFC", text or "").split())
+
+def pack_embedding(vector: Optional[Sequence[float]], normalize: bool = EMBEDDING_NORMALIZE) -> Optional[bytes]:
+    """Chuyển embedding sang BLOB float32, mặc định chuẩn hóa về độ dài 1 để cosine chỉ còn là tích vô hướng"""
+    if vector is None or len(vector) == 0:
+        return None
+    array = np.asarray(vector, dtype=np.float32)
+    if normalize:
+        norm = np.linalg.norm(array)
+        if norm > 0:
+            array = array / norm
+    return array.astype(np.float32, copy=False).tobytes()
+
+def unpack_embedding(value: Union[bytes, str, Sequence[float], None]) -> Optional[np.ndarray]:
+    """
+    Đọc embedding đã lưu. BLOB được đọc bằng np.frombuffer (không copy, chỉ đọc);
+    chuỗi JSON kiểu cũ vẫn được hỗ trợ cho các dòng chưa migrate.
+    """
+    if value is None:
+        return None
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        if len(value) == 0:
+            return None
+        return np.frombuffer(value, dtype=np.float32)
+    # Cột JSON cũ lưu chuỗi json.dumps nên có thể bị mã hóa JSON hai lần
+    while isinstance(value, str):
+        value = json.loads(value)
+    if not value:
+        return None
+    array = np.asarray(value, dtype=np.float32)
+    if EMBEDDING_NORMALIZE:
+        norm = np.linalg.norm(array)
+        if norm > 0:
+            array = array / norm
+    return array
+
+# /api/embeddings và /api/embed của Ollama chuẩn hóa/cắt input khác nhau nên vector không dùng lẫn được
+EMBED_ENDPOINT_SINGLE = "embeddings"
+EMBED_ENDPOINT_BATCH = "embed"
+
+def embedding_cache_key(model: str, translate: bool, text: str, endpoint: str = EMBED_ENDPOINT_SINGLE) -> str:
+    raw = f"{model}\x00{int(translate)}\x00{normalize_text(text)}"
+    if endpoint != EMBED_ENDPOINT_SINGLE:
+        # Khóa của /api/embeddings giữ dạng cũ để cache đã có trên đĩa vẫn dùng được
+        raw = f"{endpoint}\x00{raw}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+_SQLITE_MAX_PARAMS = 500
+
+class EmbeddingCache:
+    """
+    Cache embedding theo nội dung với hai tầng:
+    - Tầng bộ nhớ: LRU giới hạn số phần tử
+    - Tầng đĩa (tùy chọn): SQLite, giữ lại được sau khi restart
+    """
+    def __init__(self, max_items: int, path: Optional[str] = None):
+        self.max_items = max_items
+        self.path = path
+        self._memory: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = None
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.stores = 0
+        if path:
+            try:
+                self._conn = sqlite3.connect(path, check_same_thread=False)
+                self._conn.execute(
+                    "CREATE TABLE IF NOT EXISTS embeddings ("
+                    "key TEXT PRIMARY KEY, model TEXT, dim INTEGER, vector BLOB, created_at REAL)"
+                )
+                self._conn.commit()
+            except sqlite3.Error as e:
+                print(f"Không mở được cache embedding trên đĩa {path}: {str(e)}")
+                self._conn = None
+
+    def _remember(self, key: str, vector: np.ndarray) -> None:
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_items:
+            self._memory.popitem(last=False)
+
+    def _disk_get(self, key: str) -> Optional[np.ndarray]:
+        with self._lock:
+            row = self._conn.execute("SELECT vector FROM embeddings WHERE key = ?", (key,)).fetchone()
+        if not row:
+            return None
+        return np.frombuffer(row[0], dtype=np.float32)
+
+    def _disk_put(self, key: str, model: str, vector: np.ndarray) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO embeddings (key, model, dim, vector, created_at) VALUES (?, ?, ?, ?, ?)",
+                (key, model, int(vector.shape[0]), vector.tobytes(), time.time())
+            )
+            self._conn.commit()
+
+    def _disk_get_many(self, keys: Sequence[str]) -> Dict[str, np.ndarray]:
+        found = {}
+        with self._lock:
+            # Chia nhỏ để không vượt giới hạn số tham số của SQLite
+            for start in range(0, len(keys), _SQLITE_MAX_PARAMS):
+                part = keys[start:start + _SQLITE_MAX_PARAMS]
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(part))})", part
+                ).fetchall()
+                for key, vector in rows:
+                    found[key] = np.frombuffer(vector, dtype=np.float32)
+        return found
+
+    def _disk_put_many(self, items: Sequence[Tuple[str, np.ndarray]], model: str) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, model, dim, vector, created_at) VALUES (?, ?, ?, ?, ?)",
+                [(key, model, int(vector.shape[0]), vector.tobytes(), now) for key, vector in items]
+            )
+            self._conn.commit()
+
+    async def get(self, key: str) -> Optional[np.ndarray]:
+        vector = self._memory.get(key)
+        if vector is not None:
+            self._memory.move_to_end(key)
+            self.memory_hits += 1
+            return vector
+        if self._conn is not None:
+            try:
+                vector = await asyncio.to_thread(self._disk_get, key)
+            except sqlite3.Error as e:
+                print(f"Lỗi đọc cache embedding: {str(e)}")
+                vector = None
+            if vector is not None:
+                self._remember(key, vector)
+                self.disk_hits += 1
+                return vector
+        self.misses += 1
+        return None
+
+    async def put(self, key: str, model: str, vector: np.ndarray) -> None:
+        self._remember(key, vector)
+        self.stores += 1
+        if self._conn is not None:
+            try:
+                await asyncio.to_thread(self._disk_put, key, model, vector)
+            except sqlite3.Error as e:
+                print(f"Lỗi ghi cache embedding: {str(e)}")
+
+    async def get_many(self, keys: Sequence[str]) -> List[Optional[np.ndarray]]:
+        """Như get cho nhiều khóa, các khóa không có trong bộ nhớ được đọc từ đĩa bằng một truy vấn"""
+        results: List[Optional[np.ndarray]] = [None] * len(keys)
+        missing = []
+        for i, key in enumerate(keys):
+            vector = self._memory.get(key)
+            if vector is not None:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                results[i] = vector
+            else:
+                missing.append(i)
+        found = {}
+        if missing and self._conn is not None:
+            try:
+                found = await asyncio.to_thread(self._disk_get_many, list({keys[i] for i in missing}))
+            except sqlite3.Error as e:
+                print(f"Lỗi đọc cache embedding: {str(e)}")
+        for i in missing:
+            vector = found.get(keys[i])
+            if vector is not None:
+                self._remember(keys[i], vector)
+                self.disk_hits += 1
+                results[i] = vector
+            else:
+                self.misses += 1
+        return results
+
+    async def put_many(self, items: Sequence[Tuple[str, np.ndarray]], model: str) -> None:
+        """Như put cho nhiều phần tử, ghi xuống đĩa trong một transaction"""
+        if not items:
+            return
+        for key, vector in items:
+            self._remember(key, vector)
+        self.stores += len(items)
+        if self._conn is not None:
+            try:
+                await asyncio.to_thread(self._disk_put_many, items, model)
+            except sqlite3.Error as e:
+                print(f"Lỗi ghi cache embedding: {str(e)}")
+
+    def stats(self) -> Dict:
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "stores": self.stores,
+            "hit_ratio": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+            "memory_items": len(self._memory),
+            "memory_capacity": self.max_items,
+            "persistent": self._conn is not None,
+        }
+
+EMBEDDING_CACHE = EmbeddingCache(EMBEDDING_CACHE_SIZE, EMBEDDING_CACHE_PATH or None)
+
+async def translate_text(text: str) -> str:
+    """Dịch sang tiếng Anh qua services/translate_service, lỗi thì trả lại văn bản gốc"""
+    translated = await translate_to_english(text)
+    return translated if translated is not None else text
+
+async def get_embedding(text: str, client: httpx.AsyncClient, translate: bool = True) -> list:
+    key = embedding_cache_key(EMBEDDING_MODEL, translate, text)
+    cached = await EMBEDDING_CACHE.get(key)
+    if cached is not None:
+        return cached.tolist()
+
+    input_text = normalize_text(text)
+    cacheable = True
+    if translate:
+        translated = await translate_to_english(input_text)
+        # Dịch lỗi thì vẫn embedding văn bản gốc nhưng không lưu kết quả đó vào cache
+        cacheable = translated is not None
+        input_text = translated if translated is not None else input_text
+    payload = {"model": EMBEDDING_MODEL, "prompt": input_text, "keep_alive": OLLAMA_KEEP_ALIVE}
+    try:
+        response = await client.post(f"{OLLAMA_EMB_URL}", json=payload)
+        response.raise_for_status()
+        embedding = response.json().get("embedding", [])
+    except httpx.HTTPError as e:
+        raise HTTPException(status_code=500, detail=f"Lỗi tạo embedding: {str(e)}")
+
+    if embedding and cacheable:
+        await EMBEDDING_CACHE.put(key, EMBEDDING_MODEL, np.asarray(embedding, dtype=np.float32))
+    return embedding
+
+async def get_embeddings_batch(texts: Sequence[str], client: httpx.AsyncClient,
+                               batch_size: int = EMBEDDING_BATCH_SIZE) -> List[Optional[np.ndarray]]:
+    """
+    Embedding nhiều văn bản (không dịch) qua /api/embed, mỗi request tối đa batch_size input.
+    Văn bản đã có trong cache không gửi lại; lô bị lỗi trả về None cho các văn bản của lô đó.
+    """
+    keys = [embedding_cache_key(EMBEDDING_MODEL, False, text, EMBED_ENDPOINT_BATCH) for text in texts]
+    results = await EMBEDDING_CACHE.get_many(keys)
+    missing = [i for i, cached in enumerate(results) if cached is None]
+
+    for start in range(0, len(missing), batch_size):
+        batch = missing[start:start + batch_size]
+        payload = {
+            "model": EMBEDDING_MODEL,
+            "input": [normalize_text(texts[i]) for i in batch],
+            "keep_alive": OLLAMA_KEEP_ALIVE
+        }
+        try:
+            response = await client.post(OLLAMA_EMBED_BATCH_URL, json=payload)
+            response.raise_for_status()
+            embeddings = response.json().get("embeddings", [])
+        except httpx.HTTPError as e:
+            print(f"Lỗi tạo embedding theo lô: {str(e)}")
+            continue
+        stored = []
+        for i, embedding in zip(batch, embeddings):
+            if embedding:
+                vector = np.asarray(embedding, dtype=np.float32)
+                results[i] = vector
+                stored.append((keys[i], vector))
+        await EMBEDDING_CACHE.put_many(stored, EMBEDDING_MODEL)
+    return results
@@ -0,0 +1,122 @@
+import asyncio
+import codecs
+import re
+import time
+from typing import NamedTuple, Optional
+from services.http_client import get_fetch_client
+from services.domain_health import DOMAIN_HEALTH
+from config.settings import FETCH_MAX_BYTES, FETCH_ALLOWED_CONTENT_TYPES
+
+_CHARSET_RE = re.compile(rb"""<meta[^>]+charset\s*=\s*["']?\s*([a-zA-Z0-9_\-]+)""", re.IGNORECASE)
+# Số byte đầu tiên dùng để dò <meta charset> khi header không có charset
+_SNIFF_BYTES = 4096
+
+class FetchResult(NamedTuple):
+    status: int
+    text: Optional[str]
+    etag: Optional[str]
+    last_modified: Optional[str]
+    size: int
+    truncated: bool = False
+
+def _header_charset(content_type: str) -> Optional[str]:
+    for part in content_type.split(";")[1:]:
+        key, _, value = part.strip().partition("=")
+        if key.lower() == "charset" and value:
+            return value.strip("\"' ")
+    return None
+
+def _sniff_charset(head: bytes) -> Optional[str]:
+    match = _CHARSET_RE.search(head[:_SNIFF_BYTES])
+    return match.group(1).decode("ascii", "ignore") if match else None
+
+def _make_decoder(charset: Optional[str]):
+    try:
+        return codecs.getincrementaldecoder(codecs.lookup(charset or "utf-8").name)(errors="replace")
+    except LookupError:
+        return codecs.getincrementaldecoder("utf-8")(errors="replace")
+
+def is_allowed_content_type(content_type: str) -> bool:
+    media_type = content_type.split(";")[0].strip().lower()
+    # Server không gửi Content-Type thì vẫn thử, trích xuất sẽ tự bỏ nếu không phải HTML
+    return not media_type or media_type in FETCH_ALLOWED_CONTENT_TYPES
+
+async def _fetch(url: str, etag: Optional[str], last_modified: Optional[str], max_bytes: int) -> Optional[FetchResult]:
+
+    headers = {}
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+    try:
+        async with get_fetch_client().stream("GET", url, headers=headers) as response:
+            result_etag = response.headers.get("etag")
+            result_last_modified = response.headers.get("last-modified")
+            if response.status_code != 200:
+                return FetchResult(response.status_code, None, result_etag, result_last_modified, 0)
+
+            content_type = response.headers.get("content-type", "")
+            if not is_allowed_content_type(content_type):
+                print(f"Bỏ qua {url}: Content-Type {content_type}")
+                return FetchResult(response.status_code, None, result_etag, result_last_modified, 0)
+            declared = response.headers.get("content-length")
+            if declared and declared.isdigit() and int(declared) > max_bytes:
+                print(f"Trang {url} dài {declared} bytes, chỉ đọc {max_bytes} bytes đầu")
+
+            charset = _header_charset(content_type)
+            decoder = None
+            head = b""
+            parts = []
+            size = 0
+            truncated = False
+            async for chunk in response.aiter_bytes():
+                if len(chunk) > max_bytes - size:
+                    chunk = chunk[:max_bytes - size]
+                    truncated = True
+                size += len(chunk)
+                if decoder is None:
+                    # Header không có charset thì gom vài KB đầu để dò <meta charset>
+                    head += chunk
+                    if charset is None and len(head) < _SNIFF_BYTES and not truncated:
+                        continue
+                    decoder = _make_decoder(charset or _sniff_charset(head))
+                    chunk, head = head, b""
+                parts.append(decoder.decode(chunk))
+                if truncated:
+                    break
+            if decoder is None:
+                decoder = _make_decoder(charset or _sniff_charset(head))
+                parts.append(decoder.decode(head))
+            parts.append(decoder.decode(b"", final=True))
+    except Exception as e:
+        print(f"Error fetching {url}: {str(e)}")
+        return None
+
+    return FetchResult(200, "".join(parts), result_etag, result_last_modified, size, truncated)
+
+async def fetch(url: str, etag: Optional[str] = None, last_modified: Optional[str] = None,
+                max_bytes: int = FETCH_MAX_BYTES) -> Optional[FetchResult]:
+    """
+    Tải một trang qua pool dùng chung theo kiểu streaming.
+
+    Header được kiểm tra trước khi đọc body: status khác 200 hoặc Content-Type không
+    phải HTML thì đóng kết nối ngay. Body được giải mã dần theo charset và dừng đọc khi
+    vượt max_bytes, nên phần trích xuất chỉ nhận một tài liệu có kích thước giới hạn.
+
+    Truyền etag/last_modified của bản đã cache để tải có điều kiện; server trả 304
+    thì text là None. Lỗi mạng trả về None.
+    Độ trễ và kết quả được ghi vào DOMAIN_HEALTH để ngắt mạch các domain chậm/lỗi.
+    """
+    start = time.perf_counter()
+    try:
+        result = await _fetch(url, etag, last_modified, max_bytes)
+    except asyncio.CancelledError:
+        # Bị hủy vì đã đủ trang khác: chỉ biết được độ trễ tối thiểu, vẫn tính là chậm
+        # nếu đã vượt ngưỡng để domain hay bị hủy vì chậm cũng bị ngắt mạch
+        elapsed = time.perf_counter() - start
+        if elapsed > DOMAIN_HEALTH.slow_seconds:
+            DOMAIN_HEALTH.record(url, elapsed, True)
+        raise
+    ok = result is not None and result.status < 500 and result.status != 429
+    DOMAIN_HEALTH.record(url, time.perf_counter() - start, ok)
+    return result
@@ -0,0 +1,64 @@
+import httpx
+import inspect
+from typing import Dict
+from config.settings import (
+    API_TIMEOUT, OLLAMA_MAX_CONNECTIONS, OLLAMA_MAX_KEEPALIVE_CONNECTIONS, OLLAMA_KEEPALIVE_EXPIRY,
+    FETCH_MAX_CONNECTIONS, FETCH_MAX_KEEPALIVE_CONNECTIONS, FETCH_KEEPALIVE_EXPIRY, FETCH_TIMEOUT, FETCH_USER_AGENT
+)
+
+# Các client httpx dùng chung, sống cùng vòng đời của app FastAPI
+_clients: Dict[str, httpx.AsyncClient] = {}
+
+def build_limits(max_connections: int, max_keepalive: int, keepalive_expiry: float):
+    """Tạo giới hạn pool tương thích cả httpx mới (Limits) lẫn bản 0.13 mà googletrans ghim (PoolLimits)"""
+    if hasattr(httpx, "Limits"):
+        return {"limits": httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive,
+            keepalive_expiry=keepalive_expiry
+        )}
+    return {"pool_limits": httpx.PoolLimits(max_keepalive=max_keepalive, max_connections=max_connections)}
+
+def build_redirect_option():
+    """httpx mới mặc định không theo redirect, bản 0.13 thì theo sẵn và không có tham số này"""
+    if "follow_redirects" in inspect.signature(httpx.AsyncClient.__init__).parameters:
+        return {"follow_redirects": True}
+    return {}
+
+def get_ollama_client() -> httpx.AsyncClient:
+    """
+    Trả về client dùng chung cho mọi request tới Ollama.
+
+    Client chỉ nói chuyện với một host (Ollama) nên các giới hạn của pool
+    cũng chính là giới hạn theo host.
+    """
+    client = _clients.get("ollama")
+    if client is None or getattr(client, "is_closed", False):
+        client = httpx.AsyncClient(
+            timeout=API_TIMEOUT,
+            **build_limits(OLLAMA_MAX_CONNECTIONS, OLLAMA_MAX_KEEPALIVE_CONNECTIONS, OLLAMA_KEEPALIVE_EXPIRY)
+        )
+        _clients["ollama"] = client
+    return client
+
+def get_fetch_client() -> httpx.AsyncClient:
+    """Client dùng chung để tải các trang kết quả tìm kiếm, giữ kết nối keep-alive giữa các request"""
+    client = _clients.get("fetch")
+    if client is None or getattr(client, "is_closed", False):
+        client = httpx.AsyncClient(
+            timeout=FETCH_TIMEOUT,
+            headers={"User-Agent": FETCH_USER_AGENT},
+            **build_redirect_option(),
+            **build_limits(FETCH_MAX_CONNECTIONS, FETCH_MAX_KEEPALIVE_CONNECTIONS, FETCH_KEEPALIVE_EXPIRY)
+        )
+        _clients["fetch"] = client
+    return client
+
+async def close_http_clients():
+    """Đóng toàn bộ client dùng chung, gọi khi app shutdown"""
+    for name, client in list(_clients.items()):
+        try:
+            await client.aclose()
+        except Exception as e:
+            print(f"Lỗi khi đóng HTTP client {name}: {str(e)}")
+    _clients.clear()
@@ -7,6 +7,7 @@ from auth.auth import validate_api_key
 from models.models import Subscription, ImageGenerationHistory, User
 from config.settings import API_TIMEOUT, COMFYUI_API_URL, COMFYUI_HISTORY_URL, COMFYUI_VIEW_URL
 from services.chat_service import stream_chat_service_no_auth
+from services.stream_service import collect_text
 from schemas.schemas import ChatRequest
 from config.payload import payload_genimage_realistic, payload_genimage_2d, payload_genimage_Semi_Real
 from sqlalchemy.orm import Session
@@ -142,21 +143,8 @@ async def generate_image_service(request: ImageGenRequest, user, db: Session) ->
             api_key=None
         )
 
-        full_response = ""
         check_result = await stream_chat_service_no_auth(safety_check_request, db, temperature=0.4, num_predict=-1)
-
-        async for chunk in check_result.body_iterator:
-            try:
-                chunk_str = chunk.decode('utf-8')
-                if "content" in chunk_str:
-                    data = json.loads(chunk_str)
-                    if "message" in data and "content" in data["message"]:
-                        content = data["message"]["content"]
-                        if content:
-                            full_response += content
-            except Exception as e:
-                print(f"Error processing safety check chunk: {str(e)}")
-                continue
+        full_response = await collect_text(check_result.body_iterator)
 
         try:
             # Clean and parse JSON response
@@ -295,21 +283,9 @@ async def generate_image_service(request: ImageGenRequest, user, db: Session) ->
 
     _positive_prompt = ""
     _size = "1024x1024"  # Default size
-    full_response = ""
 
     gen_prompt = await stream_chat_service_no_auth(generate_positive_prompt_request, db, temperature=0.4, num_predict=-1)
-    async for chunk in gen_prompt.body_iterator:
-        try:
-            chunk_str = chunk.decode('utf-8')
-            if "content" in chunk_str:
-                data = json.loads(chunk_str)
-                if "message" in data and "content" in data["message"]:
-                    content = data["message"]["content"]
-                    if content:
-                        full_response += content
-        except Exception as e:
-            print(f"Error processing chunk: {str(e)}")
-            continue
+    full_response = await collect_text(gen_prompt.body_iterator)
 
     if full_response:
         print(f"Full response from chat service: {full_response}")
@@ -0,0 +1,109 @@
+import asyncio
+import numpy as np
+from typing import List, Optional, Sequence, Set
+from database import SessionLocal
+from models.models import ChatHistory
+from services.retrieval import stack_embeddings
+from services.vector_index import VectorIndexRegistry
+from config.settings import (
+    VECTOR_INDEX_DIR, VECTOR_INDEX_NPROBE, VECTOR_INDEX_MIN_TRAIN, VECTOR_INDEX_MAX_LOADED,
+    VECTOR_INDEX_SAVE_INTERVAL, LONG_TERM_MEMORY_TOP_K, LONG_TERM_MEMORY_MIN_SCORE
+)
+
+def _chat_memory_filter(query, user_id: int):
+    # Tin nhắn của conversation đã xóa còn lại với conversation_id NULL, không đưa vào bộ nhớ
+    return query.filter(
+        ChatHistory.user_id == user_id,
+        ChatHistory.embedding.isnot(None),
+        ChatHistory.conversation_id.isnot(None)
+    )
+
+def _load_chat_vectors(user_id: int):
+    db = SessionLocal()
+    try:
+        rows = _chat_memory_filter(
+            db.query(ChatHistory.id, ChatHistory.conversation_id, ChatHistory.embedding), user_id
+        ).all()
+    finally:
+        db.close()
+    matrix, positions = stack_embeddings([row.embedding for row in rows])
+    ids = [rows[i].id for i in positions]
+    tags = [rows[i].conversation_id for i in positions]
+    return ids, tags, matrix
+
+def _count_chat_vectors(user_id: int) -> int:
+    db = SessionLocal()
+    try:
+        return _chat_memory_filter(db.query(ChatHistory.id), user_id).count()
+    finally:
+        db.close()
+
+# Index bộ nhớ dài hạn: mỗi user một index trên toàn bộ ChatHistory.embedding, tag là conversation_id
+CHAT_MEMORY_INDEX = VectorIndexRegistry(
+    namespace="chat",
+    directory=VECTOR_INDEX_DIR,
+    loader=_load_chat_vectors,
+    counter=_count_chat_vectors,
+    nprobe=VECTOR_INDEX_NPROBE,
+    min_train=VECTOR_INDEX_MIN_TRAIN,
+    max_loaded=VECTOR_INDEX_MAX_LOADED,
+    save_interval=VECTOR_INDEX_SAVE_INTERVAL
+)
+
+async def remember_message(user_id: int, history_id: int, conversation_id: int, embedding) -> None:
+    """Thêm (hoặc cập nhật) một tin nhắn vào index của user"""
+    if embedding is None or len(embedding) == 0 or conversation_id is None:
+        return
+    try:
+        await CHAT_MEMORY_INDEX.add(user_id, [history_id], [conversation_id], np.asarray([embedding], dtype=np.float32))
+    except Exception as e:
+        print(f"Lỗi cập nhật bộ nhớ dài hạn: {str(e)}")
+
+# Các lần ghi chạy nền, giữ tham chiếu để task không bị thu hồi giữa chừng và chờ được khi shutdown
+_background_writes: Set[asyncio.Task] = set()
+
+def remember_message_later(user_id: int, history_id: int, conversation_id: int, embedding) -> asyncio.Task:
+    """Như remember_message nhưng chạy nền, không chặn request (vd. trước khi sinh câu trả lời)"""
+    task = asyncio.ensure_future(remember_message(user_id, history_id, conversation_id, embedding))
+    _background_writes.add(task)
+    task.add_done_callback(_background_writes.discard)
+    return task
+
+async def flush_memory() -> None:
+    """Chờ các lần ghi nền còn dở rồi lưu index, gọi khi app shutdown"""
+    if _background_writes:
+        await asyncio.gather(*_background_writes, return_exceptions=True)
+    await CHAT_MEMORY_INDEX.flush()
+
+async def forget_messages(user_id: int, history_ids: Sequence[int]) -> None:
+    try:
+        await CHAT_MEMORY_INDEX.remove(user_id, list(history_ids))
+    except Exception as e:
+        print(f"Lỗi xóa khỏi bộ nhớ dài hạn: {str(e)}")
+
+async def forget_conversation(user_id: int, conversation_id: int) -> None:
+    try:
+        await CHAT_MEMORY_INDEX.remove_tag(user_id, conversation_id)
+    except Exception as e:
+        print(f"Lỗi xóa conversation khỏi bộ nhớ dài hạn: {str(e)}")
+
+def _load_rows(ids: List[int]) -> List[ChatHistory]:
+    db = SessionLocal()
+    try:
+        rows_by_id = {row.id: row for row in db.query(ChatHistory).filter(ChatHistory.id.in_(ids)).all()}
+        db.expunge_all()
+    finally:
+        db.close()
+    return [rows_by_id[i] for i in ids if i in rows_by_id]
+
+async def recall(user_id: int, embedding, exclude_conversation_id: Optional[int] = None,
+                 k: int = LONG_TERM_MEMORY_TOP_K, min_score: float = LONG_TERM_MEMORY_MIN_SCORE) -> List[ChatHistory]:
+    """Tìm các tin nhắn liên quan nhất từ những conversation khác của user"""
+    if embedding is None or len(embedding) == 0:
+        return []
+    hits = await CHAT_MEMORY_INDEX.search(user_id, embedding, k, exclude_tag=exclude_conversation_id)
+    hit_ids = [hit_id for hit_id, _, score in hits if score >= min_score]
+    if not hit_ids:
+        return []
+    # Session riêng trong thread, không dùng chung session của request đang chạy song song ở stage khác
+    return await asyncio.to_thread(_load_rows, hit_ids)
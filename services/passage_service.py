@@ -0,0 +1,88 @@
+import asyncio
+from typing import Dict, List, Optional, Sequence
+import httpx
+import numpy as np
+from services.embedding_service import get_embeddings_batch
+from services.token_service import count_tokens_batch
+from services.text_extraction import split_passages
+from config.settings import SEARCH_CONTEXT_TOKENS
+
+class Passage:
+    def __init__(self, source: int, position: int, text: str, tokens: int = 0):
+        self.source = source
+        self.position = position
+        self.text = text
+        self.tokens = tokens
+
+def _pick_within_budget(passages: List[Passage], order: Sequence[int], budget: int) -> List[Passage]:
+    picked, used = [], 0
+    for i in order:
+        passage = passages[i]
+        if used + passage.tokens > budget:
+            continue
+        picked.append(passage)
+        used += passage.tokens
+    return picked
+
+async def select_passages(results: List[Dict], query_embedding: Optional[Sequence[float]], client: httpx.AsyncClient,
+                          budget: int = SEARCH_CONTEXT_TOKENS) -> List[Passage]:
+    """
+    Chọn các đoạn liên quan nhất với prompt từ nội dung các trang trong giới hạn token.
+
+    Toàn bộ đoạn được embedding theo lô rồi chấm điểm bằng một phép nhân ma trận với
+    embedding của prompt. Không có embedding thì lấy lần lượt đoạn đầu của từng trang.
+
+    Returns:
+        Các đoạn được chọn, xếp theo thứ tự trang rồi vị trí trong trang
+    """
+    passages = []
+    for source, result in enumerate(results):
+        for position, text in enumerate(split_passages(result.get("content") or "")):
+            passages.append(Passage(source, position, text))
+    if not passages:
+        return []
+    # Encode token chạy trong thread để không chặn event loop
+    token_counts = await asyncio.to_thread(count_tokens_batch, [p.text for p in passages])
+    for passage, tokens in zip(passages, token_counts):
+        passage.tokens = tokens
+
+    order = None
+    query = np.asarray(query_embedding, dtype=np.float32) if query_embedding else None
+    if query is not None and np.linalg.norm(query) > 0:
+        vectors = await get_embeddings_batch([p.text for p in passages], client)
+        valid = [i for i, v in enumerate(vectors) if v is not None and v.shape[0] == query.shape[0]]
+        if valid:
+            matrix = np.stack([vectors[i] for i in valid])
+            norms = np.linalg.norm(matrix, axis=1)
+            norms[norms == 0] = 1.0
+            scores = (matrix @ (query / np.linalg.norm(query))) / norms
+            order = [valid[i] for i in np.argsort(-scores)]
+    if order is None:
+        # Xen kẽ các trang theo vị trí đoạn: đoạn đầu của mọi trang trước
+        order = sorted(range(len(passages)), key=lambda i: (passages[i].position, passages[i].source))
+
+    picked = _pick_within_budget(passages, order, budget)
+    return sorted(picked, key=lambda p: (p.source, p.position))
+
+def format_passage_context(results: List[Dict], passages: List[Passage],
+                           header: str = "Dưới đây là thông tin liên quan:") -> str:
+    """Ghép các đoạn đã chọn theo từng nguồn để đưa vào prompt"""
+    if not passages:
+        return ""
+    by_source: Dict[int, List[str]] = {}
+    for passage in passages:
+        by_source.setdefault(passage.source, []).append(passage.text)
+    context = f"{header}\n\n"
+    for idx, source in enumerate(sorted(by_source), 1):
+        result = results[source]
+        title = result.get('title', 'Không có tiêu đề')
+        url = result.get('link', result.get('href', '#'))
+        context += f"{idx}. {title}\nNguồn: {url}\n" + "\n...\n".join(by_source[source]) + "\n\n"
+    return context
+
+async def build_search_context(results: List[Dict], query_embedding: Optional[Sequence[float]], client: httpx.AsyncClient,
+                               budget: int = SEARCH_CONTEXT_TOKENS, header: str = "Dưới đây là thông tin liên quan:") -> str:
+    if not results:
+        return ""
+    passages = await select_passages(results, query_embedding, client, budget)
+    return format_passage_context(results, passages, header)
@@ -0,0 +1,88 @@
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence
+
+class Stage:
+    """
+    Một bước trong pipeline trước khi sinh câu trả lời.
+
+    Args:
+        name: Tên stage, dùng làm khóa trong kết quả
+        func: Coroutine function nhận kết quả các stage phụ thuộc qua keyword (theo tên stage)
+        deps: Tên các stage cần chạy xong trước
+        timeout: Thời gian tối đa (giây) cho riêng stage này, None là không giới hạn
+        default: Giá trị trả về khi stage lỗi hoặc quá thời gian
+    """
+    def __init__(self, name: str, func: Callable[..., Awaitable[Any]], deps: Sequence[str] = (),
+                 timeout: Optional[float] = None, default: Any = None):
+        self.name = name
+        self.func = func
+        self.deps = tuple(deps)
+        self.timeout = timeout
+        self.default = default
+
+def _check_graph(stages: List[Stage]) -> None:
+    """Kiểm tra tên trùng, phụ thuộc không tồn tại và vòng lặp trong đồ thị"""
+    by_name = {}
+    for stage in stages:
+        if stage.name in by_name:
+            raise ValueError(f"Stage bị trùng tên: {stage.name}")
+        by_name[stage.name] = stage
+    for stage in stages:
+        for dep in stage.deps:
+            if dep not in by_name:
+                raise ValueError(f"Stage {stage.name} phụ thuộc vào stage không tồn tại: {dep}")
+
+    visiting, done = set(), set()
+    def visit(name: str):
+        if name in done:
+            return
+        if name in visiting:
+            raise ValueError(f"Đồ thị stage có vòng lặp tại: {name}")
+        visiting.add(name)
+        for dep in by_name[name].deps:
+            visit(dep)
+        visiting.discard(name)
+        done.add(name)
+    for stage in stages:
+        visit(stage.name)
+
+async def run_stages(stages: List[Stage]) -> Dict[str, Any]:
+    """
+    Chạy các stage theo đồ thị phụ thuộc.
+
+    Các stage không phụ thuộc nhau chạy đồng thời; một stage bắt đầu ngay khi
+    các stage nó cần đã xong. Stage lỗi hoặc quá timeout trả về giá trị default
+    thay vì làm hỏng cả request.
+
+    Returns:
+        Dictionary tên stage -> kết quả
+    """
+    _check_graph(stages)
+    tasks: Dict[str, asyncio.Task] = {}
+
+    async def run(stage: Stage):
+        dep_results = {}
+        for dep in stage.deps:
+            dep_results[dep] = await tasks[dep]
+        start = time.perf_counter()
+        try:
+            result = await asyncio.wait_for(stage.func(**dep_results), timeout=stage.timeout)
+            print(f"[DEBUG] Stage {stage.name}: {time.perf_counter() - start:.3f}s")
+            return result
+        except asyncio.TimeoutError:
+            print(f"Stage {stage.name} quá thời gian {stage.timeout}s, dùng giá trị mặc định")
+        except Exception as e:
+            print(f"Lỗi ở stage {stage.name}: {str(e)}")
+        return stage.default
+
+    # Tạo task cho tất cả stage trước, các task chỉ đợi nhau khi bắt đầu chạy
+    for stage in stages:
+        tasks[stage.name] = asyncio.ensure_future(run(stage))
+    try:
+        results = await asyncio.gather(*tasks.values())
+    except BaseException:
+        for task in tasks.values():
+            task.cancel()
+        raise
+    return dict(zip(tasks.keys(), results))
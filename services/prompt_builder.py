@@ -0,0 +1,91 @@
+from typing import Dict, List, Sequence
+from config.settings import DEFAULT_SYSTEM, PROMPT_LAYOUT
+
+# Phần đầu prompt không đổi giữa các lượt để Ollama dùng lại KV cache của prefix
+STABLE_SYSTEM_PROMPT = f"""Bạn là một AI assistant tích hợp với khả năng tìm kiếm thông tin chủ động.
+{DEFAULT_SYSTEM}
+Mỗi câu hỏi của user có thể kèm khối [NGỮ CẢNH] chứa thời gian hiện tại, thông tin tìm kiếm, tài liệu và ghi nhớ liên quan.
+Hãy sử dụng thông tin trong đó để trả lời chính xác và đáng tin cậy; nếu thông tin không đủ,
+hãy nói rõ những gì chưa tìm thấy và đề xuất hướng tìm kiếm khác."""
+
+def build_turn_context(username: str, current_time: str, memory_context: str = "", search_context: str = "",
+                       searched: bool = True, tools_enabled: bool = False, document_context: str = "") -> str:
+    """Phần thay đổi theo từng lượt (thời gian, kết quả tìm kiếm...), luôn đặt ở cuối prompt"""
+    parts = [
+        f"User: `{username}`",
+        f"Thời điểm hiện tại: `{current_time}`",
+    ]
+    if memory_context:
+        parts.append(memory_context.strip())
+    if document_context:
+        parts.append(document_context.strip())
+    if search_context:
+        parts.append(search_context.strip())
+    elif tools_enabled:
+        parts.append("Nếu cần thông tin mới hoặc chưa chắc chắn, hãy gọi công cụ web_search.")
+    elif searched and not document_context:
+        parts.append("Tôi đã tìm kiếm nhưng không tìm thấy thông tin phù hợp với yêu cầu của bạn.")
+    return "[NGỮ CẢNH]\n" + "\n\n".join(parts) + "\n[/NGỮ CẢNH]"
+
+def with_turn_context(prompt: str, turn_context: str) -> str:
+    return f"{turn_context}\n\n{prompt}"
+
+def with_summary(system_prompt: str, summary: str) -> str:
+    """Bản tóm tắt chỉ đổi khi job tóm tắt chạy nên được đặt trong phần prefix"""
+    if not summary:
+        return system_prompt
+    return f"{system_prompt}\n\n[TÓM TẮT CUỘC TRÒ CHUYỆN TRƯỚC ĐÓ]\n{summary.strip()}\n[/TÓM TẮT]"
+
+def _legacy_system_prompt(username: str, current_time: str, memory_context: str, search_context: str,
+                          document_context: str = "") -> str:
+    return f"""
+      Bạn là một AI assistant tích hợp với khả năng tìm kiếm thông tin chủ động.
+
+      Bạn đang hỗ trợ cho user tên: `{username}`.
+      Thời điểm hiện tại: `{current_time}`.
+
+      {DEFAULT_SYSTEM}
+
+      {memory_context}
+
+      {document_context}
+
+      Dựa trên yêu cầu của user, tôi đã chủ động tìm kiếm và thu thập được thông tin sau:
+      {search_context if search_context else 'Tôi đã tìm kiếm nhưng không tìm thấy thông tin phù hợp với yêu cầu của bạn.'}
+
+      Hãy sử dụng thông tin tôi vừa tìm được để trả lời câu hỏi của user một cách chính xác và đáng tin cậy.
+      Nếu thông tin không đủ, hãy nói rõ những gì chưa tìm thấy và đề xuất hướng tìm kiếm khác.
+    """
+
+def build_chat_messages(history: Sequence, prompt: str, username: str, current_time: str,
+                        memory_context: str = "", search_context: str = "", summary: str = "",
+                        searched: bool = True, tools_enabled: bool = False, document_context: str = "",
+                        layout: str = PROMPT_LAYOUT) -> List[Dict[str, str]]:
+    """
+    Ghép messages gửi cho Ollama.
+
+    layout="stable": system prompt cố định, lịch sử theo thứ tự thời gian, phần ngữ cảnh
+    thay đổi được gắn vào tin nhắn user cuối cùng. Không dùng message system ở cuối vì
+    template của model gom mọi message system lên đầu prompt, làm prefix đổi mỗi lượt.
+
+    layout="legacy": cách cũ, toàn bộ ngữ cảnh nằm trong system prompt ở đầu.
+
+    summary là bản tóm tắt phần lịch sử cũ hơn history, được nối vào system prompt.
+    searched=False (gate bỏ qua tìm kiếm) thì không báo "không tìm thấy"; tools_enabled
+    nhắc model có thể tự gọi web_search. document_context là các đoạn tài liệu của user.
+    """
+    history_messages = [{"role": hist.role, "content": hist.content} for hist in history]
+    if layout == "legacy":
+        system_prompt = _legacy_system_prompt(username, current_time, memory_context, search_context, document_context)
+        messages = [{"role": "system", "content": with_summary(system_prompt, summary)}]
+        messages += history_messages
+        messages.append({"role": "user", "content": prompt})
+        return messages
+
+    turn_context = build_turn_context(username, current_time, memory_context, search_context,
+                                      searched=searched, tools_enabled=tools_enabled,
+                                      document_context=document_context)
+    messages = [{"role": "system", "content": with_summary(STABLE_SYSTEM_PROMPT, summary)}]
+    messages += history_messages
+    messages.append({"role": "user", "content": with_turn_context(prompt, turn_context)})
+    return messages
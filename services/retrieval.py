@@ -0,0 +1,46 @@
+import numpy as np
+from typing import List, Optional, Sequence, Tuple
+
+def stack_embeddings(blobs: Sequence[Optional[bytes]], normalize: bool = False) -> Tuple[np.ndarray, List[int]]:
+    """
+    Ghép các BLOB float32 thành ma trận (N, d) bằng một lần np.frombuffer.
+
+    Returns:
+        (ma trận, vị trí trong blobs tương ứng với từng hàng); các BLOB rỗng
+        hoặc sai số chiều bị bỏ qua.
+    """
+    sizes = [len(b) for b in blobs if b]
+    if not sizes:
+        return np.zeros((0, 0), dtype=np.float32), []
+    # Số chiều phổ biến nhất, tránh một dòng hỏng làm lệch cả ma trận
+    dim_bytes = max(set(sizes), key=sizes.count)
+    positions = [i for i, b in enumerate(blobs) if b and len(b) == dim_bytes]
+    buffer = b"".join(bytes(blobs[i]) for i in positions)
+    matrix = np.frombuffer(buffer, dtype=np.float32).reshape(len(positions), dim_bytes // 4)
+    if normalize:
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        matrix = matrix / norms
+    return matrix, positions
+
+def top_k_similar(matrix: np.ndarray, query: Sequence[float], k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Tính cosine giữa query và toàn bộ hàng của ma trận đã chuẩn hóa bằng một phép nhân
+    ma trận-vector, rồi lấy top-k bằng argpartition.
+
+    Returns:
+        (chỉ số hàng, điểm) sắp xếp theo điểm giảm dần
+    """
+    if matrix.size == 0 or k <= 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+    q = np.asarray(query, dtype=np.float32)
+    norm = np.linalg.norm(q)
+    if norm == 0 or q.shape[0] != matrix.shape[1]:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+    scores = matrix @ (q / norm)
+    if k >= scores.shape[0]:
+        order = np.argsort(-scores)
+    else:
+        order = np.argpartition(-scores, k - 1)[:k]
+        order = order[np.argsort(-scores[order])]
+    return order, scores[order]
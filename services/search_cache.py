@@ -0,0 +1,199 @@
+import asyncio
+import copy
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, List, NamedTuple, Optional, Tuple
+from config.settings import (
+    SEARCH_QUERY_CACHE_TTL, SEARCH_QUERY_CACHE_SIZE, PAGE_CACHE_PATH, PAGE_CACHE_MAX_BYTES, PAGE_CACHE_FRESH_SECONDS
+)
+
+def normalize_query(query: str) -> str:
+    return " ".join(unicodedata.normalize("NFC", query or "").lower().split())
+
+class QueryCache:
+    """Tầng 1: kết quả tìm kiếm theo truy vấn đã chuẩn hóa, giữ trong bộ nhớ với TTL ngắn"""
+    def __init__(self, ttl: float, max_items: int):
+        self.ttl = ttl
+        self.max_items = max_items
+        self._items: "OrderedDict[Tuple[str, int], Tuple[float, List[Dict]]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, query: str, max_results: int) -> Optional[List[Dict]]:
+        key = (normalize_query(query), max_results)
+        item = self._items.get(key)
+        if item is not None and item[0] > time.monotonic():
+            self._items.move_to_end(key)
+            self.hits += 1
+            return copy.deepcopy(item[1])
+        if item is not None:
+            del self._items[key]
+        self.misses += 1
+        return None
+
+    def put(self, query: str, max_results: int, results: List[Dict]) -> None:
+        if self.ttl <= 0 or not results:
+            return
+        key = (normalize_query(query), max_results)
+        self._items[key] = (time.monotonic() + self.ttl, copy.deepcopy(results))
+        self._items.move_to_end(key)
+        while len(self._items) > self.max_items:
+            self._items.popitem(last=False)
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "items": len(self._items),
+            "ttl": self.ttl,
+        }
+
+class CachedPage(NamedTuple):
+    content: str
+    etag: Optional[str]
+    last_modified: Optional[str]
+    html_bytes: int
+    fresh: bool
+
+class PageCache:
+    """
+    Tầng 2: nội dung đã trích xuất của từng URL, lưu trong SQLite.
+
+    Trong PAGE_CACHE_FRESH_SECONDS sau lần tải, nội dung được dùng luôn; quá thời gian
+    đó thì tải lại có điều kiện (If-None-Match / If-Modified-Since), server trả 304
+    thì dùng lại nội dung cũ. Tổng dung lượng bị giới hạn, xóa trang lâu không dùng trước.
+    """
+    def __init__(self, path: Optional[str], max_bytes: int, fresh_seconds: float):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.fresh_seconds = fresh_seconds
+        self._lock = threading.Lock()
+        self._conn = None
+        self.fresh_hits = 0
+        self.revalidated = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self.bytes_saved = 0
+        if path:
+            try:
+                self._conn = sqlite3.connect(path, check_same_thread=False)
+                self._conn.execute(
+                    "CREATE TABLE IF NOT EXISTS pages ("
+                    "url TEXT PRIMARY KEY, content TEXT, etag TEXT, last_modified TEXT, "
+                    "html_bytes INTEGER, size INTEGER, fetched_at REAL, accessed_at REAL)"
+                )
+                self._conn.execute("CREATE INDEX IF NOT EXISTS idx_pages_accessed_at ON pages (accessed_at)")
+                self._conn.commit()
+            except sqlite3.Error as e:
+                print(f"Không mở được cache trang trên đĩa {path}: {str(e)}")
+                self._conn = None
+
+    def _get(self, url: str) -> Optional[CachedPage]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT content, etag, last_modified, html_bytes, fetched_at FROM pages WHERE url = ?", (url,)
+            ).fetchone()
+            if not row:
+                return None
+            self._conn.execute("UPDATE pages SET accessed_at = ? WHERE url = ?", (time.time(), url))
+            self._conn.commit()
+        content, etag, last_modified, html_bytes, fetched_at = row
+        return CachedPage(content, etag, last_modified, html_bytes or 0, time.time() - fetched_at < self.fresh_seconds)
+
+    def _put(self, url: str, content: str, etag: Optional[str], last_modified: Optional[str], html_bytes: int) -> None:
+        size = len(content.encode("utf-8"))
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO pages (url, content, etag, last_modified, html_bytes, size, fetched_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (url, content, etag, last_modified, html_bytes, size, now, now)
+            )
+            total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM pages").fetchone()[0]
+            while total > self.max_bytes:
+                oldest = self._conn.execute(
+                    "SELECT url, size FROM pages ORDER BY accessed_at ASC LIMIT 64"
+                ).fetchall()
+                if not oldest:
+                    break
+                for old_url, old_size in oldest:
+                    if total <= self.max_bytes:
+                        break
+                    self._conn.execute("DELETE FROM pages WHERE url = ?", (old_url,))
+                    total -= old_size or 0
+                    self.evictions += 1
+            self._conn.commit()
+
+    def _touch(self, url: str) -> None:
+        with self._lock:
+            now = time.time()
+            self._conn.execute("UPDATE pages SET fetched_at = ?, accessed_at = ? WHERE url = ?", (now, now, url))
+            self._conn.commit()
+
+    async def get(self, url: str) -> Optional[CachedPage]:
+        if self._conn is None:
+            return None
+        try:
+            page = await asyncio.to_thread(self._get, url)
+        except sqlite3.Error as e:
+            print(f"Lỗi đọc cache trang: {str(e)}")
+            return None
+        if page is None:
+            self.misses += 1
+        elif page.fresh:
+            self.fresh_hits += 1
+            self.bytes_saved += page.html_bytes
+        return page
+
+    async def put(self, url: str, content: str, etag: Optional[str], last_modified: Optional[str], html_bytes: int) -> None:
+        if self._conn is None or not content:
+            return
+        self.stores += 1
+        try:
+            await asyncio.to_thread(self._put, url, content, etag, last_modified, html_bytes)
+        except sqlite3.Error as e:
+            print(f"Lỗi ghi cache trang: {str(e)}")
+
+    async def mark_revalidated(self, url: str, page: CachedPage) -> None:
+        """Server trả 304: làm mới thời điểm tải, không phải tải lại và trích xuất lại"""
+        self.revalidated += 1
+        self.bytes_saved += page.html_bytes
+        try:
+            await asyncio.to_thread(self._touch, url)
+        except sqlite3.Error as e:
+            print(f"Lỗi ghi cache trang: {str(e)}")
+
+    def mark_refetched(self) -> None:
+        """Trang cũ đã bị server thay đổi, phải tải lại"""
+        self.misses += 1
+
+    def _disk_usage(self) -> Tuple[int, int]:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM pages").fetchone()
+
+    def stats(self) -> Dict:
+        # Trang cũ mà server không trả 304 được tính là miss
+        lookups = self.fresh_hits + self.revalidated + self.misses
+        items, size = self._disk_usage() if self._conn is not None else (0, 0)
+        return {
+            "fresh_hits": self.fresh_hits,
+            "revalidated": self.revalidated,
+            "misses": self.misses,
+            "stores": self.stores,
+            "evictions": self.evictions,
+            "hit_ratio": (self.fresh_hits + self.revalidated) / lookups if lookups else 0.0,
+            "bytes_saved": self.bytes_saved,
+            "items": items,
+            "size_bytes": size,
+            "max_bytes": self.max_bytes,
+            "persistent": self._conn is not None,
+        }
+
+QUERY_CACHE = QueryCache(SEARCH_QUERY_CACHE_TTL, SEARCH_QUERY_CACHE_SIZE)
+PAGE_CACHE = PageCache(PAGE_CACHE_PATH or None, PAGE_CACHE_MAX_BYTES, PAGE_CACHE_FRESH_SECONDS)
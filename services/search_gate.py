@@ -0,0 +1,117 @@
+import re
+import time
+from collections import Counter
+from typing import Dict, Optional, Tuple
+import httpx
+from config.prompts import SEARCH_TRIGGER_PATTERNS, SEARCH_FRESHNESS_PATTERNS, NO_SEARCH_PATTERNS
+from config.settings import OLLAMA_API_URL, OLLAMA_KEEP_ALIVE, SEARCH_GATE_MAYBE_POLICY, SEARCH_GATE_CLASSIFIER_MODEL
+
+SEARCH = "search"
+NO_SEARCH = "no_search"
+MAYBE = "maybe"
+
+_URL_RE = re.compile(r"https?://\S+", re.IGNORECASE)
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+# Tên riêng/viết tắt giữa câu (vd "Apple", "GPT-4") gợi ý câu hỏi về thực thể cụ thể
+_ENTITY_RE = re.compile(r"(?<=\s)[A-ZĐ][\w\-]*\d*|\b[A-Z]{2,}\b")
+
+def _combine(patterns) -> re.Pattern:
+    return re.compile("|".join(f"(?:{pattern})" for pattern in patterns), re.IGNORECASE)
+
+class SearchGate:
+    """
+    Quyết định rẻ (không gọi mạng) xem một tin nhắn có cần tìm kiếm web không.
+
+    Các pattern được gộp thành một regex biên dịch sẵn cho mỗi nhóm, cộng thêm vài
+    heuristic về độ dài, URL và tên riêng. Trường hợp "maybe" được xử lý theo
+    SEARCH_GATE_MAYBE_POLICY: "search", "skip" hoặc "classifier" (hỏi model nhỏ).
+    """
+    def __init__(self, maybe_policy: str = SEARCH_GATE_MAYBE_POLICY,
+                 classifier_model: str = SEARCH_GATE_CLASSIFIER_MODEL):
+        self.maybe_policy = maybe_policy
+        self.classifier_model = classifier_model
+        self._trigger_re = _combine(SEARCH_TRIGGER_PATTERNS)
+        self._freshness_re = _combine(SEARCH_FRESHNESS_PATTERNS)
+        self._no_search_re = _combine(NO_SEARCH_PATTERNS)
+        self.decisions = Counter()
+        self.reasons = Counter()
+        self.resolved = Counter()
+        self.missed = Counter()
+        self.total_decide_seconds = 0.0
+
+    def decide(self, prompt: str) -> Tuple[str, str]:
+        """Trả về (quyết định, lý do)"""
+        start = time.perf_counter()
+        decision, reason = self._decide(prompt.strip())
+        self.total_decide_seconds += time.perf_counter() - start
+        self.decisions[decision] += 1
+        self.reasons[reason] += 1
+        return decision, reason
+
+    def _decide(self, text: str) -> Tuple[str, str]:
+        if not text:
+            return NO_SEARCH, "empty"
+        if _URL_RE.search(text):
+            return SEARCH, "url"
+        if self._trigger_re.search(text):
+            return SEARCH, "trigger_pattern"
+        if self._freshness_re.search(text):
+            return SEARCH, "freshness_pattern"
+        if self._no_search_re.search(text):
+            return NO_SEARCH, "no_search_pattern"
+        words = _WORD_RE.findall(text)
+        if len(words) <= 3 and "?" not in text:
+            return NO_SEARCH, "short_message"
+        if "?" in text and _ENTITY_RE.search(text):
+            return MAYBE, "question_with_entity"
+        return MAYBE, "default"
+
+    async def _classify(self, prompt: str, client: httpx.AsyncClient) -> bool:
+        payload = {
+            "model": self.classifier_model,
+            "messages": [{"role": "user", "content": (
+                "Câu hỏi sau có cần tìm kiếm thông tin trên internet để trả lời chính xác không? "
+                f"Chỉ trả lời YES hoặc NO.\n\n{prompt}"
+            )}],
+            "stream": False,
+            "keep_alive": OLLAMA_KEEP_ALIVE,
+            "options": {"temperature": 0, "num_predict": 3, "think": False}
+        }
+        response = await client.post(OLLAMA_API_URL, json=payload)
+        if response.status_code != 200:
+            return True
+        answer = response.json().get("message", {}).get("content", "").strip().upper()
+        return not answer.startswith("NO")
+
+    async def should_search(self, prompt: str, client: Optional[httpx.AsyncClient] = None) -> bool:
+        decision, reason = self.decide(prompt)
+        needed = decision == SEARCH
+        if decision == MAYBE:
+            if self.maybe_policy == "classifier" and client is not None:
+                try:
+                    needed = await self._classify(prompt, client)
+                except httpx.HTTPError as e:
+                    print(f"Lỗi phân loại nhu cầu tìm kiếm: {str(e)}")
+                    needed = True
+            else:
+                needed = self.maybe_policy != "skip"
+            self.resolved["search" if needed else "skip"] += 1
+        print(f"[DEBUG] Search gate: {decision} ({reason}) -> {'search' if needed else 'skip'}")
+        return needed
+
+    def record_miss(self, searched: bool) -> None:
+        """Ghi nhận câu trả lời vẫn cần thêm thông tin, dùng để chỉnh gate"""
+        self.missed["after_search" if searched else "after_skip"] += 1
+
+    def stats(self) -> Dict:
+        total = sum(self.decisions.values())
+        return {
+            "decisions": dict(self.decisions),
+            "reasons": dict(self.reasons),
+            "maybe_resolved": dict(self.resolved),
+            "need_more_info": dict(self.missed),
+            "maybe_policy": self.maybe_policy,
+            "avg_decide_us": self.total_decide_seconds / total * 1e6 if total else 0.0,
+        }
+
+SEARCH_GATE = SearchGate()
@@ -0,0 +1,218 @@
+import asyncio
+import json
+import re
+import threading
+import time
+from collections import deque
+from typing import Dict, List, Optional
+from ddgs import DDGS
+from services.http_client import get_fetch_client
+from config.settings import (
+    SEARCH_PROVIDER_ORDER, SEARXNG_URL, LOCAL_CORPUS_PATH,
+    SEARCH_HEDGE_DEFAULT_DELAY, SEARCH_HEDGE_MIN_DELAY, SEARCH_HEDGE_MIN_SAMPLES, SEARCH_PROVIDER_LATENCY_WINDOW
+)
+
+# Mọi provider trả về kết quả thô cùng dạng với ddgs: [{"title", "href", "body"}]
+
+# Mỗi thread một DDGS dùng lại giữa các lần tìm (giữ session HTTP của các engine)
+_ddgs_local = threading.local()
+
+def _ddgs_text(query: str, max_results: int) -> List[Dict]:
+    ddgs = getattr(_ddgs_local, "ddgs", None)
+    if ddgs is None:
+        ddgs = _ddgs_local.ddgs = DDGS()
+    # Convert generator to list để dễ debug
+    return list(ddgs.text(query, max_results=max_results))
+
+class DuckDuckGoProvider:
+    name = "ddg"
+
+    async def search(self, query: str, max_results: int) -> List[Dict]:
+        # Thêm dấu ngoặc kép để tìm chính xác cụm từ
+        # DDGS là thư viện đồng bộ nên chạy trong thread riêng
+        return await asyncio.to_thread(_ddgs_text, f'"{query}"', max_results)
+
+class SearxngProvider:
+    """Endpoint tương thích SearxNG (/search?format=json), thường chạy nội bộ"""
+    name = "searxng"
+
+    def __init__(self, base_url: str):
+        self.base_url = base_url.rstrip("/")
+
+    async def search(self, query: str, max_results: int) -> List[Dict]:
+        response = await get_fetch_client().get(
+            f"{self.base_url}/search", params={"q": query, "format": "json"}
+        )
+        response.raise_for_status()
+        return [
+            {"title": r.get("title", ""), "href": r.get("url", ""), "body": r.get("content", "")}
+            for r in response.json().get("results", [])[:max_results]
+            if r.get("url")
+        ]
+
+_TERM_RE = re.compile(r"\w+", re.UNICODE)
+
+class LocalCorpusProvider:
+    """
+    Tìm trong file JSONL nội bộ (mỗi dòng một tài liệu title/href/body) theo số từ trùng
+    với truy vấn. Không cần mạng, dùng làm dự phòng hoặc provider thay thế khi thử nghiệm.
+    """
+    name = "local"
+
+    def __init__(self, path: str):
+        self.path = path
+        self._documents: Optional[List[Dict]] = None
+
+    def _load(self) -> List[Dict]:
+        if self._documents is None:
+            documents = []
+            with open(self.path, encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        doc = json.loads(line)
+                        doc["_terms"] = set(_TERM_RE.findall(f"{doc.get('title', '')} {doc.get('body', '')}".lower()))
+                        documents.append(doc)
+            self._documents = documents
+        return self._documents
+
+    def _search(self, query: str, max_results: int) -> List[Dict]:
+        terms = set(_TERM_RE.findall(query.lower()))
+        scored = []
+        for doc in self._load():
+            score = len(terms & doc["_terms"])
+            if score:
+                scored.append((score, doc))
+        scored.sort(key=lambda item: -item[0])
+        return [
+            {"title": doc.get("title", ""), "href": doc.get("href", ""), "body": doc.get("body", "")}
+            for _, doc in scored[:max_results]
+        ]
+
+    async def search(self, query: str, max_results: int) -> List[Dict]:
+        return await asyncio.to_thread(self._search, query, max_results)
+
+def create_provider(name: str):
+    if name == "ddg":
+        return DuckDuckGoProvider()
+    if name == "searxng":
+        return SearxngProvider(SEARXNG_URL)
+    if name == "local":
+        return LocalCorpusProvider(LOCAL_CORPUS_PATH)
+    raise ValueError(f"Search provider không hợp lệ: {name}")
+
+class ProviderStats:
+    def __init__(self, window: int):
+        self.latencies = deque(maxlen=window)
+        self.calls = 0
+        self.wins = 0
+        self.empty = 0
+        self.errors = 0
+        self.hedged = 0
+
+    def percentile(self, q: float) -> Optional[float]:
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+class HedgedSearch:
+    """
+    Gọi các provider theo thứ tự ưu tiên với hedged request.
+
+    Provider đang chạy chưa trả lời sau p90 độ trễ gần đây của nó (chưa đủ mẫu thì dùng
+    SEARCH_HEDGE_DEFAULT_DELAY) thì gọi thêm provider kế tiếp; provider lỗi hoặc không
+    có kết quả thì chuyển ngay sang provider kế tiếp. Lấy kết quả đầu tiên không rỗng
+    và hủy các lần gọi còn lại.
+    """
+    def __init__(self, providers: List, default_delay: float = SEARCH_HEDGE_DEFAULT_DELAY,
+                 min_delay: float = SEARCH_HEDGE_MIN_DELAY, min_samples: int = SEARCH_HEDGE_MIN_SAMPLES,
+                 window: int = SEARCH_PROVIDER_LATENCY_WINDOW):
+        self.providers = providers
+        self.default_delay = default_delay
+        self.min_delay = min_delay
+        self.min_samples = min_samples
+        self.window = window
+        self._stats: Dict[str, ProviderStats] = {}
+
+    def _provider_stats(self, provider) -> ProviderStats:
+        stats = self._stats.get(provider.name)
+        if stats is None:
+            stats = self._stats[provider.name] = ProviderStats(self.window)
+        return stats
+
+    def hedge_delay(self, provider) -> float:
+        stats = self._provider_stats(provider)
+        if len(stats.latencies) < self.min_samples:
+            return self.default_delay
+        return max(self.min_delay, stats.percentile(0.9))
+
+    async def _call(self, provider, query: str, max_results: int) -> List[Dict]:
+        stats = self._provider_stats(provider)
+        stats.calls += 1
+        start = time.perf_counter()
+        try:
+            results = await provider.search(query, max_results)
+        except asyncio.CancelledError:
+            # Bị hủy vì provider khác trả lời trước: thời gian đã chờ là cận dưới của độ trễ,
+            # vẫn ghi lại để p90 tăng theo khi provider chậm đi thay vì hedge mãi ở ngưỡng cũ
+            stats.latencies.append(time.perf_counter() - start)
+            raise
+        except Exception as e:
+            stats.errors += 1
+            print(f"Lỗi search provider {provider.name}: {str(e)}")
+            raise
+        stats.latencies.append(time.perf_counter() - start)
+        if not results:
+            stats.empty += 1
+        return results
+
+    async def search(self, query: str, max_results: int) -> List[Dict]:
+        pending: Dict[asyncio.Task, object] = {}
+        remaining = list(self.providers)
+        launch, hedge = True, False
+        try:
+            while pending or (launch and remaining):
+                if launch and remaining:
+                    provider = remaining.pop(0)
+                    if hedge:
+                        self._provider_stats(provider).hedged += 1
+                        print(f"[DEBUG] Search hedge: gọi thêm {provider.name}")
+                    pending[asyncio.ensure_future(self._call(provider, query, max_results))] = provider
+                    last = provider
+                launch, hedge = False, False
+                # Còn provider dự phòng thì chỉ chờ provider gọi gần nhất đến hạn hedge của nó
+                timeout = self.hedge_delay(last) if remaining else None
+                done, _ = await asyncio.wait(set(pending), timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    launch, hedge = True, True
+                    continue
+                for task in done:
+                    provider = pending.pop(task)
+                    if task.exception() is None and task.result():
+                        self._provider_stats(provider).wins += 1
+                        return task.result()
+                    # Lỗi hoặc rỗng: chuyển ngay sang provider kế tiếp
+                    launch = True
+            return []
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def stats(self) -> Dict:
+        result = {}
+        for provider in self.providers:
+            stats = self._provider_stats(provider)
+            p50, p90 = stats.percentile(0.5), stats.percentile(0.9)
+            result[provider.name] = {
+                "calls": stats.calls,
+                "wins": stats.wins,
+                "empty": stats.empty,
+                "errors": stats.errors,
+                "hedged": stats.hedged,
+                "p50": round(p50, 3) if p50 is not None else None,
+                "p90": round(p90, 3) if p90 is not None else None,
+                "hedge_delay": round(self.hedge_delay(provider), 3),
+            }
+        return result
+
+SEARCH_PROVIDERS = HedgedSearch([create_provider(name) for name in SEARCH_PROVIDER_ORDER])
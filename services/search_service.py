@@ -1,10 +1,14 @@
-from bs4 import BeautifulSoup
-import requests
-from ddgs import DDGS
-from typing import List, Dict, Optional
-import trafilatura
+import asyncio
+from typing import List, Dict, Optional, Tuple
 from urllib.parse import urlparse
-import re
+import time
+from services.fetch_service import fetch
+from services.domain_health import DOMAIN_HEALTH
+from services.search_providers import SEARCH_PROVIDERS
+from services.search_cache import QUERY_CACHE, PAGE_CACHE
+from services.workers import EXTRACTION_POOL
+from services.text_extraction import extract_content_from_html
+from config.settings import SEARCH_FETCH_CONCURRENCY, SEARCH_LATENCY_BUDGET, SEARCH_MIN_SNIPPET_CHARS
 
 class SearchResult:
     def __init__(self, title: str, link: str, snippet: str, content: str = None):
@@ -30,116 +34,126 @@ def is_valid_url(url: str) -> bool:
     except:
         return False
 
-def clean_text(text: str) -> str:
-    """Làm sạch văn bản, loại bỏ khoảng trắng và ký tự đặc biệt dư thừa"""
-    if not text:
-        return ""
-    # Loại bỏ các ký tự đặc biệt
-    text = re.sub(r'[\n\r\t]+', ' ', text)
-    # Loại bỏ khoảng trắng dư thừa
-    text = re.sub(r'\s+', ' ', text)
-    return text.strip()
-
-def extract_main_content(url: str) -> Optional[str]:
-    """Trích xuất nội dung chính từ trang web sử dụng trafilatura"""
+async def extract_main_content(url: str) -> Optional[str]:
+    """
+    Lấy nội dung chính của một trang: dùng cache nếu còn mới, hết hạn thì tải lại có
+    điều kiện; trang mới tải được trích xuất trong process pool.
+    """
+    cached = await PAGE_CACHE.get(url)
+    if cached and cached.fresh:
+        return cached.content
+
+    result = await fetch(url, etag=cached.etag if cached else None,
+                         last_modified=cached.last_modified if cached else None)
+    if cached and result and result.status == 304:
+        await PAGE_CACHE.mark_revalidated(url, cached)
+        return cached.content
+    if cached:
+        PAGE_CACHE.mark_refetched()
+    if not result or not result.text:
+        return None
     try:
-        response = requests.get(url, timeout=10)
-        if response.status_code == 200:
-            # Sử dụng trafilatura để trích xuất nội dung chính
-            content = trafilatura.extract(response.text)
-            if content:
-                return clean_text(content)
-
-            # Fallback to BeautifulSoup nếu trafilatura không trích xuất được
-            soup = BeautifulSoup(response.text, 'html.parser')
-
-            # Loại bỏ các phần tử không cần thiết
-            for element in soup(['script', 'style', 'nav', 'header', 'footer', 'iframe', 'aside']):
-                element.decompose()
-
-            # Thử các chiến lược khác nhau để lấy nội dung
-            content_selectors = [
-                'article', 'main', '[role="main"]', '.content', '#content',
-                '.post', '.entry', '.article', '.post-content',
-                '[itemprop="articleBody"]', '.markdown-body',  # GitHub content
-                '.article__content', '.post__content',  # Blog formats
-                '.documentation', '.docs-content',  # Documentation sites
-                '#readme'  # GitHub README
-            ]
-
-            # 1. Thử tìm container chính
-            for selector in content_selectors:
-                main_content = soup.select_one(selector)
-                if main_content:
-                    cleaned_content = clean_text(main_content.get_text())
-                    if len(cleaned_content) > 100:  # Kiểm tra độ dài tối thiểu
-                        return cleaned_content
-
-            # 2. Nếu không tìm được container chính, lấy tất cả đoạn văn có ý nghĩa
-            paragraphs = []
-            for p in soup.find_all(['p', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'li']):
-                text = clean_text(p.get_text())
-                if len(text) > 20:  # Chỉ lấy đoạn văn có nghĩa
-                    paragraphs.append(text)
-
-            if paragraphs:
-                return '\n'.join(paragraphs)
+        content = await EXTRACTION_POOL.run(extract_content_from_html, result.text)
     except Exception as e:
         print(f"Error extracting content from {url}: {str(e)}")
         return None
+    if content:
+        await PAGE_CACHE.put(url, content, result.etag, result.last_modified, result.size)
+    return content
 
-def search_with_content(query: str, max_results: int = 5) -> List[SearchResult]:
-    """Tìm kiếm với DuckDuckGo và trích xuất nội dung từ các kết quả"""
-    results = []
-
-    # Thêm từ khóa để tối ưu tìm kiếm tiếng Việt
-    optimized_query = f'"{query}"' # Thêm dấu ngoặc kép để tìm chính xác cụm từ
-
+async def search_provider(query: str, max_results: int) -> List[Dict]:
+    """Một lần tìm qua các search provider (xem SEARCH_PROVIDERS), trả về kết quả thô (title/href/body)"""
     try:
-        with DDGS() as ddgs:
-            search_results = ddgs.text(optimized_query, max_results=max_results * 2)  # Lấy nhiều hơn để dự phòng
-
-            # Convert generator to list để dễ debug
-            search_results = list(search_results)
-            print(f"Search results: {search_results}")  # Debug log
-
-            for r in search_results:
-                if len(results) >= max_results:
-                    break
-
-                print(f"Processing result: {r}")  # Debug log
-
-                # Kiểm tra cả href và link
-                url = r.get('href') or r.get('link')
-                if not url:
-                    print(f"Warning: URL not found in result: {r}")
-                    continue
+        search_results = await SEARCH_PROVIDERS.search(query, max_results * 2)  # Lấy nhiều hơn để dự phòng
+    except Exception as e:
+        print(f"Error during search: {str(e)}")
+        return []
+    print(f"Search results: {search_results}")  # Debug log
+    return search_results
+
+def _candidates(search_results: List[Dict]) -> List[Tuple[Dict, str]]:
+    candidates = []
+    for r in search_results:
+        # Kiểm tra cả href và link
+        url = r.get('href') or r.get('link')
+        if not url:
+            print(f"Warning: URL not found in result: {r}")
+            continue
+        # Domain đang bị ngắt mạch vì chậm/lỗi liên tục thì bỏ qua như domain bị chặn
+        if is_valid_url(url) and DOMAIN_HEALTH.allow(url):
+            candidates.append((r, url))
+    return candidates
+
+async def extract_results(search_results: List[Dict], max_results: int) -> List[SearchResult]:
+    """
+    Trích xuất nội dung các trang từ kết quả thô của search_provider.
 
-                if not is_valid_url(url):
-                    continue
+    Các trang được tải đồng thời (tối đa SEARCH_FETCH_CONCURRENCY trang một lúc);
+    khi đã đủ max_results trang trích xuất được thì hủy các trang còn lại.
+    """
+    candidates = _candidates(search_results)
+    semaphore = asyncio.Semaphore(SEARCH_FETCH_CONCURRENCY)
+
+    async def fetch_result(rank: int, r: Dict, url: str):
+        async with semaphore:
+            content = await extract_main_content(url)
+        if not content:
+            return None
+        return rank, SearchResult(
+            title=r.get('title', ''),
+            link=url,
+            snippet=r.get('body', ''),
+            content=content
+        )
 
+    found = []
+    pending = {asyncio.ensure_future(fetch_result(rank, r, url)) for rank, (r, url) in enumerate(candidates)}
+    try:
+        while pending and len(found) < max_results:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
                 try:
-                    # Trích xuất nội dung
-                    content = extract_main_content(url)
-                    if not content:
-                        continue
-
-                    results.append(SearchResult(
-                        title=r.get('title', ''),
-                        link=url,  # Sử dụng url đã được xác định ở trên
-                        snippet=r.get('body', ''),
-                        content=content
-                    ))
+                    result = task.result()
                 except Exception as e:
-                    print(f"Error processing result {url}: {str(e)}")
+                    print(f"Error processing result: {str(e)}")
                     continue
-    except Exception as e:
-        print(f"Error during search: {str(e)}")
+                if result:
+                    found.append(result)
+    finally:
+        # Đủ kết quả (hoặc bị hủy từ bên ngoài): bỏ các trang chậm còn lại
+        for task in pending:
+            task.cancel()
+
+    # Giữ thứ tự xếp hạng của công cụ tìm kiếm
+    found.sort(key=lambda item: item[0])
+    return [result for _, result in found[:max_results]]
+
+async def search_with_content(query: str, max_results: int = 5) -> List[SearchResult]:
+    """Tìm kiếm và trích xuất nội dung từ các kết quả"""
+    return await extract_results(await search_provider(query, max_results), max_results)
+
+def format_results(results: List[SearchResult]) -> List[Dict]:
+    # Đảm bảo kết quả trả về có cả link và href trỏ đến cùng URL
+    formatted_results = []
+    for r in results:
+        formatted_results.append({
+            "title": r.title,
+            "link": r.link,
+            "href": r.link,  # Thêm href trỏ đến cùng URL
+            "snippet": r.snippet,
+            "content": r.content
+        })
+    return formatted_results
 
-    return results[:max_results]
+def snippet_results(search_results: List[Dict], max_results: int) -> List[Dict]:
+    """Kết quả chỉ dùng đoạn trích (body) của công cụ tìm kiếm làm nội dung"""
+    return format_results([
+        SearchResult(title=r.get('title', ''), link=url, snippet=r.get('body', ''), content=r.get('body', ''))
+        for r, url in _candidates(search_results) if r.get('body')
+    ][:max_results])
 
 # Function để sử dụng service
-def search_service(query: str, max_results: int = 5) -> List[Dict]:
+async def search_service(query: str, max_results: int = 5) -> List[Dict]:
     """
     Service function để tìm kiếm và trả về kết quả
 
@@ -150,15 +164,53 @@ def search_service(query: str, max_results: int = 5) -> List[Dict]:
     Returns:
         List of dictionaries containing search results
     """
-    results = search_with_content(query, max_results)
-    # Đảm bảo kết quả trả về có cả link và href trỏ đến cùng URL
-    formatted_results = []
-    for r in results:
-        formatted_results.append({
-            "title": r.title,
-            "link": r.link,
-            "href": r.link,  # Thêm href trỏ đến cùng URL
-            "snippet": r.snippet,
-            "content": r.content
-        })
+    cached = QUERY_CACHE.get(query, max_results)
+    if cached is not None:
+        return cached
+
+    formatted_results = format_results(await search_with_content(query, max_results))
+    QUERY_CACHE.put(query, max_results, formatted_results)
+    return formatted_results
+
+async def _full_results(query: str, search_results: List[Dict], max_results: int) -> List[Dict]:
+    try:
+        formatted_results = format_results(await extract_results(search_results, max_results))
+    except Exception as e:
+        print(f"Error extracting full pages: {str(e)}")
+        return []
+    QUERY_CACHE.put(query, max_results, formatted_results)
     return formatted_results
+
+async def adaptive_search(query: str, max_results: int = 5, latency_budget: float = SEARCH_LATENCY_BUDGET,
+                          min_snippet_chars: int = SEARCH_MIN_SNIPPET_CHARS) -> Tuple[List[Dict], Optional[asyncio.Task]]:
+    """
+    Tìm kiếm ưu tiên đoạn trích trong giới hạn thời gian.
+
+    Sau một lần gọi công cụ tìm kiếm, việc tải trang đầy đủ luôn được bắt đầu ở nền.
+    Nếu đoạn trích quá ít (dưới min_snippet_chars) thì chờ trang đầy đủ trong phần
+    thời gian còn lại của latency_budget; còn lại trả về đoạn trích ngay.
+
+    Returns:
+        (kết quả, task trả về kết quả trang đầy đủ hoặc None nếu đã dùng trang đầy đủ);
+        task dùng cho lượt tìm thêm thông tin sau đó.
+    """
+    cached = QUERY_CACHE.get(query, max_results)
+    if cached is not None:
+        return cached, None
+
+    start = time.perf_counter()
+    search_results = await search_provider(query, max_results)
+    if not search_results:
+        return [], None
+    snippets = snippet_results(search_results, max_results)
+    full_task = asyncio.ensure_future(_full_results(query, search_results, max_results))
+
+    if sum(len(r["content"]) for r in snippets) < min_snippet_chars:
+        remaining = latency_budget - (time.perf_counter() - start)
+        if remaining > 0:
+            done, _ = await asyncio.wait({full_task}, timeout=remaining)
+            if done and full_task.result():
+                print(f"[DEBUG] Adaptive search: full pages ({time.perf_counter() - start:.2f}s)")
+                return full_task.result(), None
+    print(f"[DEBUG] Adaptive search: {len(snippets)} snippets ({time.perf_counter() - start:.2f}s)")
+    return snippets, full_task
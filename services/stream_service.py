@@ -0,0 +1,219 @@
+import asyncio
+import json
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+from config.settings import STREAM_COALESCE_WINDOW, STREAM_COALESCE_MAX_BYTES, STREAM_COALESCE_QUEUE_SIZE
+
+class NdjsonParser:
+    """
+    Parser NDJSON tăng dần: nhận byte theo từng lần đọc mạng, trả về các object của những
+    dòng đã đủ. Dòng bị cắt giữa hai lần đọc (kể cả giữa một ký tự UTF-8 nhiều byte) được
+    giữ lại trong buffer; nhiều dòng trong một lần đọc được tách đủ. Dòng không phải JSON
+    bị bỏ qua và đếm vào invalid_lines.
+    """
+    def __init__(self):
+        self._buffer = bytearray()
+        self.invalid_lines = 0
+
+    def _parse_line(self, line: bytes, parsed: List[Dict[str, Any]]) -> None:
+        line = line.strip()
+        if not line:
+            return
+        try:
+            parsed.append(json.loads(line))
+        except ValueError:
+            self.invalid_lines += 1
+            print(f"Bỏ qua dòng NDJSON không hợp lệ: {line[:200]!r}")
+
+    def feed(self, data: bytes) -> List[Dict[str, Any]]:
+        parsed: List[Dict[str, Any]] = []
+        self._buffer += data
+        start = 0
+        while True:
+            end = self._buffer.find(b"\n", start)
+            if end < 0:
+                break
+            self._parse_line(bytes(self._buffer[start:end]), parsed)
+            start = end + 1
+        del self._buffer[:start]
+        return parsed
+
+    def close(self) -> List[Dict[str, Any]]:
+        """Dòng cuối không có ký tự xuống dòng"""
+        parsed: List[Dict[str, Any]] = []
+        self._parse_line(bytes(self._buffer), parsed)
+        self._buffer.clear()
+        return parsed
+
+async def iter_ndjson(chunks: AsyncIterator[bytes]) -> AsyncIterator[Dict[str, Any]]:
+    """Các object JSON của một stream NDJSON (vd. response.aiter_bytes() của Ollama)"""
+    parser = NdjsonParser()
+    async for chunk in chunks:
+        for item in parser.feed(chunk):
+            yield item
+    for item in parser.close():
+        yield item
+
+def sse_event(event: str, data: Dict[str, Any]) -> bytes:
+    """Một SSE event hoàn chỉnh: dòng event, dòng data JSON và dòng trống kết thúc"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n".encode("utf-8")
+
+def token_event(content: str) -> bytes:
+    return sse_event("token", {"content": content})
+
+def error_event(message: str) -> bytes:
+    return sse_event("error", {"error": message})
+
+def done_event(done_reason: Optional[str] = None) -> bytes:
+    return sse_event("done", {"done_reason": done_reason})
+
+def usage_event(usage: Dict[str, Any]) -> bytes:
+    return sse_event("usage", usage)
+
+# Các trường thống kê trong chunk cuối (done) của Ollama, cộng dồn qua nhiều lượt sinh
+USAGE_FIELDS = ("prompt_eval_count", "eval_count", "total_duration", "prompt_eval_duration", "eval_duration")
+
+def add_usage(usage: Dict[str, int], data: Dict[str, Any]) -> None:
+    for field in USAGE_FIELDS:
+        if isinstance(data.get(field), int):
+            usage[field] = usage.get(field, 0) + data[field]
+
+async def iter_sse(chunks: AsyncIterator[bytes]) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+    """Đọc lại stream SSE do sse_event tạo ra, trả về (tên event, data)"""
+    buffer = bytearray()
+    async for chunk in chunks:
+        buffer += chunk if isinstance(chunk, (bytes, bytearray)) else chunk.encode("utf-8")
+        while True:
+            end = buffer.find(b"\n\n")
+            if end < 0:
+                break
+            frame = bytes(buffer[:end]).decode("utf-8", errors="replace")
+            del buffer[:end + 2]
+            event, data = "message", []
+            for line in frame.split("\n"):
+                if line.startswith("event:"):
+                    event = line[6:].strip()
+                elif line.startswith("data:"):
+                    data.append(line[5:].strip())
+            try:
+                yield event, json.loads("\n".join(data)) if data else {}
+            except ValueError:
+                print(f"Bỏ qua SSE event không hợp lệ: {frame[:200]!r}")
+
+async def collect_text(chunks: AsyncIterator[bytes]) -> str:
+    """Ghép toàn bộ token của một stream SSE; event lỗi chỉ được ghi log"""
+    text = ""
+    async for event, data in iter_sse(chunks):
+        if event == "token":
+            text += data.get("content", "")
+        elif event == "error":
+            print(f"Lỗi trong stream: {data.get('error')}")
+    return text
+
+_END = object()
+_TIMEOUT = object()
+
+class StreamCoalescer:
+    """
+    Gom các chunk nhỏ (~1 token mỗi chunk) của một stream thành ít frame hơn trước khi ghi ra mạng.
+
+    Chunk đầu tiên được gửi ngay để không tăng thời gian tới token đầu. Sau đó mỗi frame
+    bắt đầu khi có chunk mới và được gửi khi đủ max_bytes hoặc hết window giây, nên độ trễ
+    thêm vào không quá window. Hết stream thì gửi nốt phần còn lại.
+
+    Stream nguồn được đọc trong một task riêng qua hàng đợi có giới hạn: chờ theo thời gian
+    không làm hủy giữa chừng việc đọc nguồn, và client đọc chậm thì nguồn cũng bị chặn lại.
+    """
+    def __init__(self, window: float = STREAM_COALESCE_WINDOW, max_bytes: int = STREAM_COALESCE_MAX_BYTES,
+                 queue_size: int = STREAM_COALESCE_QUEUE_SIZE):
+        self.window = window
+        self.max_bytes = max_bytes
+        self.queue_size = queue_size
+        self.chunks_in = 0
+        self.frames_out = 0
+
+    async def coalesce(self, source: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+        if self.window <= 0:
+            async for chunk in source:
+                yield chunk
+            return
+
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+
+        async def produce():
+            try:
+                async for chunk in source:
+                    await queue.put(chunk)
+                await queue.put(_END)
+            except Exception as e:
+                await queue.put(e)
+
+        loop = asyncio.get_running_loop()
+        producer = asyncio.ensure_future(produce())
+        getter = None
+
+        async def next_item(timeout=None):
+            # Lần get đang chờ được giữ lại khi hết giờ thay vì bị hủy, tránh mất chunk
+            nonlocal getter
+            if getter is None:
+                getter = asyncio.ensure_future(queue.get())
+            done, _ = await asyncio.wait({getter}, timeout=timeout)
+            if not done:
+                return _TIMEOUT
+            item, getter = getter.result(), None
+            return item
+
+        first = True
+        try:
+            while True:
+                item = await next_item()
+                if item is _END:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                self.chunks_in += 1
+                if first:
+                    first = False
+                    self.frames_out += 1
+                    yield item
+                    continue
+
+                buffer = bytearray(item)
+                deadline = loop.time() + self.window
+                ended = False
+                error = None
+                while len(buffer) < self.max_bytes:
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    item = await next_item(timeout)
+                    if item is _TIMEOUT:
+                        break
+                    if item is _END:
+                        ended = True
+                        break
+                    if isinstance(item, Exception):
+                        error = item
+                        break
+                    self.chunks_in += 1
+                    buffer += item
+                self.frames_out += 1
+                yield bytes(buffer)
+                if error is not None:
+                    raise error
+                if ended:
+                    return
+        finally:
+            if getter is not None:
+                getter.cancel()
+            producer.cancel()
+
+    def stats(self) -> Dict:
+        return {
+            "window": self.window,
+            "max_bytes": self.max_bytes,
+            "chunks_in": self.chunks_in,
+            "frames_out": self.frames_out,
+            "chunks_per_frame": self.chunks_in / self.frames_out if self.frames_out else 0.0,
+        }
+
+STREAM_COALESCER = StreamCoalescer()
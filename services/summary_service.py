@@ -0,0 +1,207 @@
+import asyncio
+from typing import List, Optional, Set, Tuple
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from database import SessionLocal
+from models.models import ChatHistory, ConversationSummary
+from services.http_client import get_ollama_client
+from services.token_service import count_tokens
+from config.settings import (
+    OLLAMA_API_URL, OLLAMA_KEEP_ALIVE, SUMMARY_MODEL, SUMMARY_TRIGGER_TOKENS, SUMMARY_BATCH_TOKENS,
+    SUMMARY_MAX_TOKENS, SUMMARY_SCAN_INTERVAL, CONTEXT_RECENT_TURNS
+)
+
+def get_summary(db: Session, conversation_id: int) -> Optional[ConversationSummary]:
+    return db.query(ConversationSummary).filter(ConversationSummary.conversation_id == conversation_id).first()
+
+def invalidate_summary(db: Session, conversation_id: int, history_id: int) -> bool:
+    """Xóa bản tóm tắt nếu tin nhắn bị sửa/xóa đã nằm trong phần được tóm tắt"""
+    summary = get_summary(db, conversation_id)
+    if not summary or history_id > summary.covered_until_id:
+        return False
+    db.delete(summary)
+    db.commit()
+    return True
+
+def _build_summary_prompt(previous: str, messages: List[Tuple[int, str, str]]) -> str:
+    transcript = "\n".join(
+        f"{'User' if role == 'user' else '4T'}: {content}" for _, role, content in messages
+    )
+    return f"""Bạn đang cập nhật bản tóm tắt của một cuộc trò chuyện giữa user và trợ lý 4T.
+
+Bản tóm tắt hiện tại:
+{previous or '(chưa có)'}
+
+Các tin nhắn tiếp theo:
+{transcript}
+
+Hãy viết lại bản tóm tắt, gộp thông tin từ các tin nhắn trên vào bản tóm tắt hiện tại.
+- Giữ lại yêu cầu, mục tiêu, quyết định, thông tin cá nhân user đã chia sẻ, tên riêng và số liệu quan trọng
+- Bỏ lời chào hỏi và các chi tiết không còn cần thiết
+- Viết bằng tiếng Việt, ngắn gọn, dưới {SUMMARY_MAX_TOKENS // 2} từ
+Chỉ trả về bản tóm tắt, không thêm nội dung nào khác."""
+
+class ConversationCompactor:
+    """
+    Job chạy nền giữ bản tóm tắt cuốn chiếu cho từng conversation.
+
+    Khi phần lịch sử sau watermark (trừ các lượt gần nhất) vượt trigger_tokens,
+    job gộp lần lượt từng đoạn tối đa batch_tokens vào bản tóm tắt bằng model nhỏ
+    rồi dời watermark tới tin nhắn cuối cùng đã tóm tắt. Watermark được lưu trong DB
+    nên job có thể dừng giữa chừng và tiếp tục ở lần chạy sau; request chỉ đọc kết quả.
+    """
+    def __init__(self, model: str = SUMMARY_MODEL, trigger_tokens: int = SUMMARY_TRIGGER_TOKENS,
+                 batch_tokens: int = SUMMARY_BATCH_TOKENS, max_tokens: int = SUMMARY_MAX_TOKENS,
+                 keep_recent: int = CONTEXT_RECENT_TURNS * 2, scan_interval: float = SUMMARY_SCAN_INTERVAL):
+        self.model = model
+        self.trigger_tokens = trigger_tokens
+        self.batch_tokens = batch_tokens
+        self.max_tokens = max_tokens
+        self.keep_recent = keep_recent
+        self.scan_interval = scan_interval
+        self._pending: Set[int] = set()
+        self._event: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self._task is None:
+            self._event = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    def notify(self, conversation_id: int) -> None:
+        """Báo conversation vừa có tin nhắn mới, job sẽ kiểm tra ở vòng kế tiếp"""
+        if conversation_id is None:
+            return
+        self._pending.add(conversation_id)
+        if self._event is not None:
+            self._event.set()
+
+    async def _run(self) -> None:
+        # Quét toàn bộ khi khởi động để tiếp tục các conversation còn dang dở
+        scan = True
+        while True:
+            if scan:
+                try:
+                    self._pending.update(await asyncio.to_thread(self._find_backlog))
+                except Exception as e:
+                    print(f"Lỗi quét conversation cần tóm tắt: {str(e)}")
+            while self._pending:
+                conversation_id = self._pending.pop()
+                try:
+                    await self.compact(conversation_id)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    print(f"Lỗi tóm tắt conversation {conversation_id}: {str(e)}")
+            try:
+                await asyncio.wait_for(self._event.wait(), timeout=self.scan_interval)
+                scan = False
+            except asyncio.TimeoutError:
+                scan = True
+            self._event.clear()
+
+    def _find_backlog(self) -> List[int]:
+        """Các conversation có phần chưa tóm tắt vượt ngưỡng (ước lượng, compact kiểm tra lại)"""
+        db = SessionLocal()
+        try:
+            rows = db.query(ChatHistory.conversation_id).outerjoin(
+                ConversationSummary, ConversationSummary.conversation_id == ChatHistory.conversation_id
+            ).filter(
+                ChatHistory.conversation_id.isnot(None),
+                ChatHistory.id > func.coalesce(ConversationSummary.covered_until_id, 0)
+            ).group_by(ChatHistory.conversation_id).having(
+                func.sum(ChatHistory.token_count) > self.trigger_tokens
+            ).all()
+        finally:
+            db.close()
+        return [row.conversation_id for row in rows]
+
+    def _next_batch(self, conversation_id: int):
+        db = SessionLocal()
+        try:
+            summary = get_summary(db, conversation_id)
+            watermark = summary.covered_until_id if summary else 0
+            rows = db.query(ChatHistory.id, ChatHistory.role, ChatHistory.content, ChatHistory.token_count).filter(
+                ChatHistory.conversation_id == conversation_id,
+                ChatHistory.id > watermark
+            ).order_by(ChatHistory.id.asc()).all()
+        finally:
+            db.close()
+
+        # Các lượt gần nhất luôn được gửi nguyên văn nên không tóm tắt
+        rows = rows[:max(0, len(rows) - self.keep_recent)]
+        if sum(row.token_count or 0 for row in rows) <= self.trigger_tokens:
+            return None
+        batch, used = [], 0
+        for row in rows:
+            tokens = row.token_count or 0
+            if batch and used + tokens > self.batch_tokens:
+                break
+            batch.append((row.id, row.role, row.content))
+            used += tokens
+        return (summary.content if summary else ""), watermark, batch
+
+    def _store(self, conversation_id: int, content: str, expected_watermark: int, new_watermark: int) -> bool:
+        db = SessionLocal()
+        try:
+            summary = get_summary(db, conversation_id)
+            current = summary.covered_until_id if summary else 0
+            if current != expected_watermark:
+                # Bản tóm tắt đã bị thay đổi/xóa trong lúc model đang chạy
+                return False
+            if summary is None:
+                summary = ConversationSummary(conversation_id=conversation_id)
+                db.add(summary)
+            summary.content = content
+            summary.covered_until_id = new_watermark
+            summary.token_count = count_tokens(content)
+            db.commit()
+            return True
+        finally:
+            db.close()
+
+    async def _summarize(self, previous: str, batch: List[Tuple[int, str, str]]) -> Optional[str]:
+        payload = {
+            "model": self.model,
+            "messages": [{"role": "user", "content": _build_summary_prompt(previous, batch)}],
+            "stream": False,
+            "keep_alive": OLLAMA_KEEP_ALIVE,
+            "options": {
+                "temperature": 0.2,
+                "num_predict": self.max_tokens,
+                "think": False
+            }
+        }
+        response = await get_ollama_client().post(OLLAMA_API_URL, json=payload)
+        if response.status_code != 200:
+            print(f"Lỗi API Ollama khi tóm tắt: Status {response.status_code}")
+            return None
+        return response.json().get("message", {}).get("content", "").strip() or None
+
+    async def compact(self, conversation_id: int) -> int:
+        """Gộp phần lịch sử chưa tóm tắt vào bản tóm tắt, trả về số đoạn đã gộp"""
+        rounds = 0
+        while True:
+            batch_info = await asyncio.to_thread(self._next_batch, conversation_id)
+            if not batch_info:
+                return rounds
+            previous, watermark, batch = batch_info
+            content = await self._summarize(previous, batch)
+            if not content:
+                return rounds
+            if not await asyncio.to_thread(self._store, conversation_id, content, watermark, batch[-1][0]):
+                return rounds
+            rounds += 1
+            print(f"[DEBUG] Đã tóm tắt conversation {conversation_id} tới tin nhắn {batch[-1][0]}")
+
+CONVERSATION_COMPACTOR = ConversationCompactor()
@@ -0,0 +1,95 @@
+import re
+from typing import List, Optional
+from bs4 import BeautifulSoup
+import trafilatura
+from config.settings import PASSAGE_MAX_TOKENS, PASSAGE_MAX_PER_PAGE
+
+# Xử lý văn bản thuần, không I/O và không import tầng service: process con trong pool
+# trích xuất (extract_content_from_html, parse_document) chỉ cần import module này
+
+_SENTENCE_RE = re.compile(r"(?<=[.!?。…])\s+|\n+")
+
+def clean_text(text: str) -> str:
+    """Làm sạch văn bản, loại bỏ khoảng trắng và ký tự đặc biệt dư thừa"""
+    if not text:
+        return ""
+    # Loại bỏ các ký tự đặc biệt
+    text = re.sub(r'[\n\r\t]+', ' ', text)
+    # Loại bỏ khoảng trắng dư thừa
+    text = re.sub(r'\s+', ' ', text)
+    return text.strip()
+
+def extract_content_from_html(html: str) -> Optional[str]:
+    """Trích xuất nội dung chính từ HTML sử dụng trafilatura, fallback sang BeautifulSoup"""
+    if not html:
+        return None
+    # Sử dụng trafilatura để trích xuất nội dung chính
+    content = trafilatura.extract(html)
+    if content:
+        return clean_text(content)
+
+    # Fallback to BeautifulSoup nếu trafilatura không trích xuất được
+    soup = BeautifulSoup(html, 'html.parser')
+
+    # Loại bỏ các phần tử không cần thiết
+    for element in soup(['script', 'style', 'nav', 'header', 'footer', 'iframe', 'aside']):
+        element.decompose()
+
+    # Thử các chiến lược khác nhau để lấy nội dung
+    content_selectors = [
+        'article', 'main', '[role="main"]', '.content', '#content',
+        '.post', '.entry', '.article', '.post-content',
+        '[itemprop="articleBody"]', '.markdown-body',  # GitHub content
+        '.article__content', '.post__content',  # Blog formats
+        '.documentation', '.docs-content',  # Documentation sites
+        '#readme'  # GitHub README
+    ]
+
+    # 1. Thử tìm container chính
+    for selector in content_selectors:
+        main_content = soup.select_one(selector)
+        if main_content:
+            cleaned_content = clean_text(main_content.get_text())
+            if len(cleaned_content) > 100:  # Kiểm tra độ dài tối thiểu
+                return cleaned_content
+
+    # 2. Nếu không tìm được container chính, lấy tất cả đoạn văn có ý nghĩa
+    paragraphs = []
+    for p in soup.find_all(['p', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'li']):
+        text = clean_text(p.get_text())
+        if len(text) > 20:  # Chỉ lấy đoạn văn có nghĩa
+            paragraphs.append(text)
+
+    if paragraphs:
+        return '\n'.join(paragraphs)
+    return None
+
+def split_passages(text: str, max_tokens: int = PASSAGE_MAX_TOKENS, max_passages: int = PASSAGE_MAX_PER_PAGE) -> List[str]:
+    """
+    Cắt nội dung trang thành các đoạn ngắn theo ranh giới câu.
+
+    Độ dài được ước lượng theo số từ (~0.75 từ mỗi token) để không phải encode khi cắt;
+    câu dài hơn giới hạn bị cắt cứng theo từ.
+    """
+    max_words = max(1, int(max_tokens * 0.75))
+    passages, current, current_words = [], [], 0
+    for sentence in _SENTENCE_RE.split(text or ""):
+        words = sentence.split()
+        while len(words) > max_words:
+            if current:
+                passages.append(" ".join(current))
+                current, current_words = [], 0
+            passages.append(" ".join(words[:max_words]))
+            words = words[max_words:]
+        if not words:
+            continue
+        if current_words + len(words) > max_words:
+            passages.append(" ".join(current))
+            current, current_words = [], 0
+        current.extend(words)
+        current_words += len(words)
+        if len(passages) >= max_passages:
+            break
+    if current and len(passages) < max_passages:
+        passages.append(" ".join(current))
+    return passages[:max_passages]
@@ -0,0 +1,11 @@
+import tiktoken
+from typing import List
+
+ENCODING = tiktoken.encoding_for_model("gpt-3.5-turbo")
+
+def count_tokens(text: str) -> int:
+    return len(ENCODING.encode(text or ""))
+
+def count_tokens_batch(texts: List[str], num_threads: int = 8) -> List[int]:
+    """Đếm token cho nhiều văn bản, tiktoken chia việc encode ra nhiều thread"""
+    return [len(tokens) for tokens in ENCODING.encode_batch([text or "" for text in texts], num_threads=num_threads)]
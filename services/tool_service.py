@@ -0,0 +1,65 @@
+import asyncio
+import json
+from typing import Dict, List
+from services.search_service import search_service
+from services.embedding_service import get_embedding
+from services.passage_service import build_search_context
+from services.http_client import get_ollama_client
+
+# Công cụ web_search khai báo cho Ollama theo định dạng function calling
+WEB_SEARCH_TOOL = {
+    "type": "function",
+    "function": {
+        "name": "web_search",
+        "description": (
+            "Tìm kiếm trên internet khi cần thông tin mới, thời sự hoặc thông tin bạn không chắc chắn. "
+            "Không dùng cho chào hỏi hay câu hỏi bạn đã biết rõ câu trả lời."
+        ),
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "query": {
+                    "type": "string",
+                    "description": "Truy vấn tìm kiếm ngắn gọn, ưu tiên tiếng Anh"
+                }
+            },
+            "required": ["query"]
+        }
+    }
+}
+
+CHAT_TOOLS = [WEB_SEARCH_TOOL]
+
+def _arguments(call: Dict) -> Dict:
+    arguments = call.get("function", {}).get("arguments") or {}
+    if isinstance(arguments, str):
+        try:
+            arguments = json.loads(arguments)
+        except ValueError:
+            arguments = {"query": arguments}
+    return arguments if isinstance(arguments, dict) else {}
+
+async def run_tool_call(call: Dict, max_results: int = 3) -> Dict:
+    """Thực thi một tool call của model, trả về message role "tool" để gửi lại cho model"""
+    name = call.get("function", {}).get("name", "")
+    if name != "web_search":
+        return {"role": "tool", "tool_name": name, "content": f"Không có công cụ {name}"}
+    query = str(_arguments(call).get("query", "")).strip()
+    if not query:
+        return {"role": "tool", "tool_name": name, "content": "Thiếu tham số query"}
+    print(f"[DEBUG] Tool web_search: {query}")
+    client = get_ollama_client()
+    try:
+        results = await search_service(query, max_results=max_results)
+        # Chỉ trả cho model các đoạn liên quan nhất tới truy vấn của nó
+        query_embedding = await get_embedding(query, client, translate=False) if results else None
+        content = await build_search_context(results, query_embedding, client,
+                                             header=f"Kết quả tìm kiếm cho \"{query}\":")
+    except Exception as e:
+        print(f"Lỗi khi chạy công cụ web_search: {str(e)}")
+        content = ""
+    return {"role": "tool", "tool_name": name, "content": content or f"Không tìm thấy kết quả cho \"{query}\""}
+
+async def run_tool_calls(calls: List[Dict]) -> List[Dict]:
+    # Các lần tìm kiếm độc lập nhau nên chạy đồng thời
+    return list(await asyncio.gather(*(run_tool_call(call) for call in calls)))
@@ -0,0 +1,173 @@
+import asyncio
+import hashlib
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional
+from config.settings import (
+    TRANSLATION_BACKEND, TRANSLATION_LOCAL_MODEL, TRANSLATION_WORKERS, TRANSLATION_CACHE_SIZE
+)
+
+# Chữ cái chỉ có trong tiếng Việt (đã bỏ dấu thanh bằng NFD)
+_VIETNAMESE_CHARS = set("ăâđêôơưĂÂĐÊÔƠƯ")
+_VIETNAMESE_TONE_MARKS = {"̀", "́", "̃", "̉", "̣"}
+# Từ tiếng Việt thường gặp khi gõ không dấu
+_VIETNAMESE_ASCII_WORDS = {
+    "la", "cua", "va", "khong", "toi", "ban", "minh", "nhung", "duoc", "nay", "cho", "voi",
+    "mot", "cac", "nhu", "nao", "gi", "sao", "lam", "co", "di", "roi", "thi", "ma", "oi"
+}
+_WORD_RE = re.compile(r"[^\W\d_]+", re.UNICODE)
+
+def detect_language(text: str) -> str:
+    """
+    Nhận diện ngôn ngữ rẻ, không gọi mạng: "vi", "en" hoặc "other".
+
+    Có chữ cái/dấu riêng của tiếng Việt là "vi"; toàn ASCII thì xét tỉ lệ từ
+    tiếng Việt không dấu phổ biến; còn lại là "other".
+    """
+    words = _WORD_RE.findall(text or "")
+    if not words:
+        return "en"
+    decomposed = unicodedata.normalize("NFD", "".join(words))
+    if any(ch in _VIETNAMESE_CHARS or ch in _VIETNAMESE_TONE_MARKS for ch in decomposed):
+        return "vi"
+    if all(ch.isascii() for ch in decomposed):
+        vietnamese = sum(1 for word in words if word.lower() in _VIETNAMESE_ASCII_WORDS)
+        return "vi" if vietnamese >= max(2, len(words) * 0.25) else "en"
+    return "other"
+
+class GoogleBackend:
+    """googletrans, cần mạng; mỗi thread một Translator vì thư viện không an toàn đa luồng"""
+    name = "google"
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def translate(self, text: str, src: str) -> str:
+        translator = getattr(self._local, "translator", None)
+        if translator is None:
+            from googletrans import Translator
+            translator = self._local.translator = Translator()
+        return translator.translate(text, src="auto" if src == "other" else src, dest="en").text
+
+class LocalBackend:
+    """Model MarianMT chạy offline qua transformers, tải lười ở lần dịch đầu tiên"""
+    name = "local"
+
+    def __init__(self, model_name: str):
+        self.model_name = model_name
+        self._lock = threading.Lock()
+        self._tokenizer = None
+        self._model = None
+
+    def _load(self):
+        with self._lock:
+            if self._model is None:
+                from transformers import MarianMTModel, MarianTokenizer
+                self._tokenizer = MarianTokenizer.from_pretrained(self.model_name)
+                self._model = MarianMTModel.from_pretrained(self.model_name)
+                self._model.eval()
+        return self._tokenizer, self._model
+
+    def translate(self, text: str, src: str) -> str:
+        tokenizer, model = self._load()
+        inputs = tokenizer([text], return_tensors="pt", truncation=True, max_length=512)
+        outputs = model.generate(**inputs, max_new_tokens=512)
+        return tokenizer.decode(outputs[0], skip_special_tokens=True)
+
+class NoopBackend:
+    """Không dịch, dùng khi model embedding đa ngôn ngữ"""
+    name = "none"
+
+    def translate(self, text: str, src: str) -> str:
+        return text
+
+def create_backend(name: str):
+    if name == "google":
+        return GoogleBackend()
+    if name == "local":
+        return LocalBackend(TRANSLATION_LOCAL_MODEL)
+    if name == "none":
+        return NoopBackend()
+    raise ValueError(f"TRANSLATION_BACKEND không hợp lệ: {name}")
+
+class TranslationService:
+    """
+    Dịch sang tiếng Anh mà không chặn event loop.
+
+    Backend chạy trong thread pool giới hạn số worker; kết quả được cache LRU theo
+    hash nội dung và các request trùng nội dung đang chạy dùng chung một lần dịch.
+    """
+    def __init__(self, backend, max_workers: int = TRANSLATION_WORKERS, cache_size: int = TRANSLATION_CACHE_SIZE):
+        self.backend = backend
+        self.cache_size = cache_size
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="translate")
+        self._cache: "OrderedDict[str, str]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+        self.skipped = 0
+        self.errors = 0
+
+    def _key(self, text: str) -> str:
+        return hashlib.sha256(f"{self.backend.name}\x00{text}".encode("utf-8")).hexdigest()
+
+    def _remember(self, key: str, value: str) -> None:
+        self._cache[key] = value
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    async def translate(self, text: str) -> Optional[str]:
+        """Trả về bản tiếng Anh, văn bản gốc nếu đã là tiếng Anh, None nếu dịch lỗi"""
+        language = detect_language(text)
+        if language == "en" or isinstance(self.backend, NoopBackend):
+            self.skipped += 1
+            return text
+
+        key = self._key(text)
+        cached = self._cache.get(key)
+        if cached is not None:
+            self._cache.move_to_end(key)
+            self.hits += 1
+            return cached
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            try:
+                return await asyncio.shield(inflight) or None
+            except Exception:
+                return None
+
+        self.misses += 1
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(self._executor, self.backend.translate, text, language)
+        self._inflight[key] = future
+        try:
+            result = await asyncio.shield(future)
+        except Exception as e:
+            self.errors += 1
+            print(f"Lỗi dịch văn bản: {str(e)}")
+            return None
+        finally:
+            self._inflight.pop(key, None)
+        if result:
+            self._remember(key, result)
+        return result or None
+
+    def stats(self) -> dict:
+        return {
+            "backend": self.backend.name,
+            "cached_items": len(self._cache),
+            "hits": self.hits,
+            "misses": self.misses,
+            "skipped": self.skipped,
+            "errors": self.errors
+        }
+
+TRANSLATION_SERVICE = TranslationService(create_backend(TRANSLATION_BACKEND))
+
+async def translate_to_english(text: str) -> Optional[str]:
+    return await TRANSLATION_SERVICE.translate(text)
@@ -0,0 +1,400 @@
+import asyncio
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+import numpy as np
+
+class _InvertedList:
+    """Một danh sách của IVF: id, tag và vector được lưu liền nhau, xóa bằng cách đổi chỗ với phần tử cuối"""
+    __slots__ = ("ids", "tags", "vectors", "size")
+
+    def __init__(self, dim: int, capacity: int = 16):
+        self.ids = np.empty(capacity, dtype=np.int64)
+        self.tags = np.empty(capacity, dtype=np.int64)
+        self.vectors = np.empty((capacity, dim), dtype=np.float32)
+        self.size = 0
+
+    def _reserve(self, needed: int) -> None:
+        capacity = self.ids.shape[0]
+        if needed <= capacity:
+            return
+        capacity = max(needed, capacity * 2)
+        for name in ("ids", "tags"):
+            grown = np.empty(capacity, dtype=np.int64)
+            grown[:self.size] = getattr(self, name)[:self.size]
+            setattr(self, name, grown)
+        vectors = np.empty((capacity, self.vectors.shape[1]), dtype=np.float32)
+        vectors[:self.size] = self.vectors[:self.size]
+        self.vectors = vectors
+
+    def extend(self, ids: np.ndarray, tags: np.ndarray, vectors: np.ndarray) -> int:
+        """Thêm nhiều phần tử, trả về vị trí của phần tử đầu tiên"""
+        start = self.size
+        self._reserve(start + len(ids))
+        self.ids[start:start + len(ids)] = ids
+        self.tags[start:start + len(ids)] = tags
+        self.vectors[start:start + len(ids)] = vectors
+        self.size += len(ids)
+        return start
+
+    def pop(self, pos: int) -> Optional[int]:
+        """Xóa phần tử tại pos, trả về id của phần tử bị chuyển vào chỗ trống (nếu có)"""
+        last = self.size - 1
+        moved = None
+        if pos != last:
+            self.ids[pos] = self.ids[last]
+            self.tags[pos] = self.tags[last]
+            self.vectors[pos] = self.vectors[last]
+            moved = int(self.ids[pos])
+        self.size -= 1
+        return moved
+
+def _normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+def _assign(data: np.ndarray, centroids: np.ndarray, chunk: int = 4096) -> np.ndarray:
+    """Gán mỗi vector về centroid gần nhất (theo cosine), chia khối để giới hạn bộ nhớ tạm"""
+    result = np.empty(data.shape[0], dtype=np.int64)
+    for start in range(0, data.shape[0], chunk):
+        result[start:start + chunk] = np.argmax(data[start:start + chunk] @ centroids.T, axis=1)
+    return result
+
+def _spherical_kmeans(data: np.ndarray, nlist: int, iterations: int, rng: np.random.Generator) -> np.ndarray:
+    centroids = data[rng.choice(data.shape[0], nlist, replace=False)].copy()
+    for _ in range(iterations):
+        assign = _assign(data, centroids)
+        counts = np.bincount(assign, minlength=nlist)
+        order = np.argsort(assign, kind="stable")
+        nonempty = np.nonzero(counts)[0]
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))[nonempty]
+        sums = np.add.reduceat(data[order], starts, axis=0)
+        centroids[nonempty] = _normalize_rows(sums)
+        empty = np.nonzero(counts == 0)[0]
+        if len(empty):
+            centroids[empty] = data[rng.choice(data.shape[0], len(empty), replace=False)]
+    return centroids
+
+class IVFIndex:
+    """
+    Chỉ mục vector IVF-flat viết bằng NumPy, dùng cosine trên vector đã chuẩn hóa.
+
+    Dưới min_train phần tử chỉ có một danh sách (quét toàn bộ). Từ đó trở đi
+    index được huấn luyện bằng spherical k-means với khoảng sqrt(N) danh sách,
+    và huấn luyện lại mỗi khi số phần tử tăng gấp đôi. Mỗi phần tử có một tag
+    (ví dụ conversation_id) để lọc khi tìm kiếm hoặc xóa theo nhóm.
+    """
+    def __init__(self, dim: int, nprobe: int = 8, min_train: int = 2048, sample_size: int = 20000):
+        self.dim = dim
+        self.nprobe = nprobe
+        self.min_train = min_train
+        self.sample_size = sample_size
+        self.centroids: Optional[np.ndarray] = None
+        self.lists: List[_InvertedList] = [_InvertedList(dim)]
+        self.locations: Dict[int, Tuple[int, int]] = {}
+        self.trained_size = 0
+        self.lock = threading.RLock()
+        self.dirty = False
+        # Các thay đổi trong lúc train chạy ngoài lock, được áp lại lên danh sách mới khi train xong
+        self._pending: Optional[List[Tuple]] = None
+
+    def __len__(self) -> int:
+        return len(self.locations)
+
+    def _insert(self, ids: np.ndarray, tags: np.ndarray, vectors: np.ndarray) -> None:
+        if self.centroids is None:
+            list_numbers = np.zeros(len(ids), dtype=np.int64)
+        else:
+            list_numbers = _assign(vectors, self.centroids)
+        for list_no in np.unique(list_numbers):
+            mask = list_numbers == list_no
+            target = self.lists[list_no]
+            start = target.extend(ids[mask], tags[mask], vectors[mask])
+            for offset, item_id in enumerate(ids[mask].tolist()):
+                self.locations[item_id] = (int(list_no), start + offset)
+
+    def add(self, ids: Sequence[int], tags: Sequence[int], vectors) -> None:
+        ids = np.asarray(ids, dtype=np.int64)
+        if len(ids) == 0:
+            return
+        tags = np.asarray(tags, dtype=np.int64)
+        vectors = _normalize_rows(np.asarray(vectors, dtype=np.float32).reshape(len(ids), self.dim))
+        with self.lock:
+            self._add(ids, tags, vectors)
+            if self._pending is not None:
+                self._pending.append(("add", ids, tags, vectors))
+            self.dirty = True
+
+    def _add(self, ids: np.ndarray, tags: np.ndarray, vectors: np.ndarray) -> None:
+        # Thêm lại id đã có nghĩa là cập nhật
+        self._remove([i for i in ids.tolist() if i in self.locations])
+        self._insert(ids, tags, vectors)
+
+    def _remove(self, ids: Sequence[int]) -> int:
+        removed = 0
+        for item_id in ids:
+            location = self.locations.pop(int(item_id), None)
+            if location is None:
+                continue
+            list_no, pos = location
+            moved = self.lists[list_no].pop(pos)
+            if moved is not None:
+                self.locations[moved] = (list_no, pos)
+            removed += 1
+        return removed
+
+    def remove(self, ids: Sequence[int]) -> int:
+        with self.lock:
+            removed = self._remove(ids)
+            if self._pending is not None and removed:
+                self._pending.append(("remove", list(ids)))
+            self.dirty = self.dirty or removed > 0
+            return removed
+
+    def remove_tag(self, tag: int) -> int:
+        with self.lock:
+            ids = []
+            for lst in self.lists:
+                mask = lst.tags[:lst.size] == tag
+                ids.extend(lst.ids[:lst.size][mask].tolist())
+            return self.remove(ids)
+
+    def search(self, query, k: int, exclude_tag: Optional[int] = None) -> List[Tuple[int, int, float]]:
+        """
+        Returns:
+            Danh sách (id, tag, điểm cosine) theo điểm giảm dần
+        """
+        q = np.asarray(query, dtype=np.float32).reshape(-1)
+        norm = np.linalg.norm(q)
+        if k <= 0 or norm == 0 or q.shape[0] != self.dim:
+            return []
+        q = q / norm
+        with self.lock:
+            if self.centroids is None:
+                probes = [0]
+            else:
+                nprobe = min(self.nprobe, self.centroids.shape[0])
+                centroid_scores = self.centroids @ q
+                probes = np.argpartition(-centroid_scores, nprobe - 1)[:nprobe].tolist()
+            scores, ids, tags = [], [], []
+            for list_no in probes:
+                lst = self.lists[list_no]
+                if lst.size == 0:
+                    continue
+                list_scores = lst.vectors[:lst.size] @ q
+                if exclude_tag is not None:
+                    list_scores = np.where(lst.tags[:lst.size] == exclude_tag, -np.inf, list_scores)
+                scores.append(list_scores)
+                ids.append(lst.ids[:lst.size])
+                tags.append(lst.tags[:lst.size])
+            if not scores:
+                return []
+            scores = np.concatenate(scores)
+            ids = np.concatenate(ids)
+            tags = np.concatenate(tags)
+        k = min(k, scores.shape[0])
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(ids[i]), int(tags[i]), float(scores[i])) for i in top if np.isfinite(scores[i])]
+
+    def _export(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        ids, tags, vectors, list_numbers = [], [], [], []
+        for list_no, lst in enumerate(self.lists):
+            ids.append(lst.ids[:lst.size])
+            tags.append(lst.tags[:lst.size])
+            vectors.append(lst.vectors[:lst.size])
+            list_numbers.append(np.full(lst.size, list_no, dtype=np.int64))
+        return (np.concatenate(ids), np.concatenate(tags),
+                np.concatenate(vectors) if vectors else np.zeros((0, self.dim), dtype=np.float32),
+                np.concatenate(list_numbers))
+
+    def needs_training(self) -> bool:
+        n = len(self)
+        return n >= self.min_train and n >= 2 * max(self.trained_size, self.min_train // 2)
+
+    def train(self, iterations: int = 10, seed: int = 0) -> None:
+        """
+        Huấn luyện lại centroid và chia lại toàn bộ phần tử vào các danh sách.
+
+        K-means và việc chia lại chạy trên bản sao dữ liệu, ngoài lock, để search/add
+        không bị chặn trong lúc train. Lock chỉ được giữ lại để thay danh sách mới vào
+        và áp lại các thay đổi đã xảy ra trong lúc đó.
+        """
+        with self.lock:
+            if self._pending is not None:
+                return
+            ids, tags, vectors, _ = self._export()
+            n = len(ids)
+            if n < self.min_train:
+                return
+            self._pending = []
+        try:
+            rng = np.random.default_rng(seed)
+            nlist = int(min(4096, max(1, np.sqrt(n))))
+            sample = vectors if n <= self.sample_size else vectors[rng.choice(n, self.sample_size, replace=False)]
+            trained = IVFIndex(self.dim, nprobe=self.nprobe, min_train=self.min_train, sample_size=self.sample_size)
+            trained.centroids = _spherical_kmeans(sample, nlist, iterations, rng)
+            trained.lists = [_InvertedList(self.dim) for _ in range(nlist)]
+            trained._insert(ids, tags, vectors)
+        except BaseException:
+            with self.lock:
+                self._pending = None
+            raise
+        with self.lock:
+            pending, self._pending = self._pending, None
+            self.centroids, self.lists, self.locations = trained.centroids, trained.lists, trained.locations
+            for op in pending:
+                if op[0] == "add":
+                    self._add(*op[1:])
+                else:
+                    self._remove(op[1])
+            self.trained_size = n
+            self.dirty = True
+
+    def save(self, path: str) -> None:
+        with self.lock:
+            ids, tags, vectors, list_numbers = self._export()
+            centroids = self.centroids if self.centroids is not None else np.zeros((0, self.dim), dtype=np.float32)
+            trained_size = self.trained_size
+            self.dirty = False
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(f, ids=ids, tags=tags, vectors=vectors, list_numbers=list_numbers,
+                     centroids=centroids, trained_size=np.int64(trained_size))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str, **kwargs) -> "IVFIndex":
+        with np.load(path) as data:
+            vectors = data["vectors"]
+            index = cls(vectors.shape[1], **kwargs)
+            centroids = data["centroids"]
+            if centroids.shape[0]:
+                index.centroids = centroids
+                index.lists = [_InvertedList(index.dim) for _ in range(centroids.shape[0])]
+            index.trained_size = int(data["trained_size"])
+            ids, tags, list_numbers = data["ids"], data["tags"], data["list_numbers"]
+            for list_no in np.unique(list_numbers):
+                mask = list_numbers == list_no
+                start = index.lists[list_no].extend(ids[mask], tags[mask], vectors[mask])
+                for offset, item_id in enumerate(ids[mask].tolist()):
+                    index.locations[item_id] = (int(list_no), start + offset)
+        return index
+
+class VectorIndexRegistry:
+    """
+    Quản lý index theo user: nạp lười từ đĩa (hoặc dựng lại từ DB qua loader),
+    giữ tối đa max_loaded index trong bộ nhớ, lưu định kỳ và huấn luyện lại ở nền.
+
+    Args:
+        namespace: Tiền tố tên file, cho phép nhiều loại index cùng thư mục
+        loader: Hàm đồng bộ user_id -> (ids, tags, vectors) đọc toàn bộ dữ liệu gốc
+        counter: Hàm đồng bộ user_id -> số phần tử trong dữ liệu gốc, dùng để phát hiện file lệch
+    """
+    def __init__(self, namespace: str, directory: str, loader: Callable, counter: Callable,
+                 dim: int = 768, nprobe: int = 8, min_train: int = 2048,
+                 max_loaded: int = 64, save_interval: float = 30.0):
+        self.namespace = namespace
+        self.directory = directory
+        self.loader = loader
+        self.counter = counter
+        self.dim = dim
+        self.index_kwargs = {"nprobe": nprobe, "min_train": min_train}
+        self.max_loaded = max_loaded
+        self.save_interval = save_interval
+        self._indexes: "OrderedDict[int, IVFIndex]" = OrderedDict()
+        self._loading: Dict[int, asyncio.Lock] = {}
+        self._last_saved: Dict[int, float] = {}
+        self._background: Dict[Tuple[int, str], asyncio.Task] = {}
+
+    def _path(self, user_id: int) -> str:
+        return os.path.join(self.directory, f"{self.namespace}_{user_id}.npz")
+
+    def _load_or_build(self, user_id: int) -> IVFIndex:
+        path = self._path(user_id)
+        if os.path.exists(path):
+            try:
+                index = IVFIndex.load(path, **self.index_kwargs)
+                if len(index) == self.counter(user_id):
+                    return index
+                print(f"Index {path} lệch với dữ liệu gốc, dựng lại")
+            except Exception as e:
+                print(f"Lỗi đọc index {path}: {str(e)}")
+        ids, tags, vectors = self.loader(user_id)
+        index = IVFIndex(vectors.shape[1] if len(ids) else self.dim, **self.index_kwargs)
+        index.add(ids, tags, vectors)
+        if index.needs_training():
+            index.train()
+        index.save(path)
+        return index
+
+    async def get(self, user_id: int) -> IVFIndex:
+        index = self._indexes.get(user_id)
+        if index is not None:
+            self._indexes.move_to_end(user_id)
+            return index
+        lock = self._loading.setdefault(user_id, asyncio.Lock())
+        async with lock:
+            index = self._indexes.get(user_id)
+            if index is None:
+                index = await asyncio.to_thread(self._load_or_build, user_id)
+                self._indexes[user_id] = index
+                self._last_saved[user_id] = time.monotonic()
+                await self._evict()
+        return index
+
+    async def _evict(self) -> None:
+        while len(self._indexes) > self.max_loaded:
+            user_id, index = self._indexes.popitem(last=False)
+            if index.dirty:
+                await asyncio.to_thread(index.save, self._path(user_id))
+
+    def _run_background(self, user_id: int, kind: str, func: Callable) -> None:
+        key = (user_id, kind)
+        task = self._background.get(key)
+        if task is not None and not task.done():
+            return
+        self._background[key] = asyncio.ensure_future(asyncio.to_thread(func))
+
+    def _after_update(self, user_id: int, index: IVFIndex) -> None:
+        if index.needs_training():
+            self._run_background(user_id, "train", index.train)
+        if time.monotonic() - self._last_saved.get(user_id, 0) >= self.save_interval:
+            self._last_saved[user_id] = time.monotonic()
+            self._run_background(user_id, "save", lambda: index.save(self._path(user_id)))
+
+    async def add(self, user_id: int, ids: Sequence[int], tags: Sequence[int], vectors) -> None:
+        index = await self.get(user_id)
+        await asyncio.to_thread(index.add, ids, tags, vectors)
+        self._after_update(user_id, index)
+
+    async def remove(self, user_id: int, ids: Sequence[int]) -> None:
+        index = await self.get(user_id)
+        await asyncio.to_thread(index.remove, ids)
+        self._after_update(user_id, index)
+
+    async def remove_tag(self, user_id: int, tag: int) -> None:
+        index = await self.get(user_id)
+        await asyncio.to_thread(index.remove_tag, tag)
+        self._after_update(user_id, index)
+
+    async def search(self, user_id: int, query, k: int, exclude_tag: Optional[int] = None) -> List[Tuple[int, int, float]]:
+        index = await self.get(user_id)
+        return await asyncio.to_thread(index.search, query, k, exclude_tag)
+
+    async def flush(self) -> None:
+        """Lưu mọi index còn thay đổi chưa ghi, gọi khi app shutdown"""
+        for task in list(self._background.values()):
+            if not task.done():
+                try:
+                    await task
+                except Exception as e:
+                    print(f"Lỗi tác vụ nền của index: {str(e)}")
+        for user_id, index in list(self._indexes.items()):
+            if index.dirty:
+                await asyncio.to_thread(index.save, self._path(user_id))
@@ -0,0 +1,86 @@
+import asyncio
+import multiprocessing
+import signal
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Optional
+from config.settings import EXTRACTION_WORKERS, EXTRACTION_CPU_LIMIT
+
+# Sau lần báo đầu tiên timer tiếp tục báo theo chu kỳ này, phòng khi code thư viện nuốt mất tín hiệu
+_CPU_LIMIT_REPEAT = 0.1
+
+class CpuLimitExceeded(Exception):
+    """Công việc trong process pool dùng quá thời gian CPU cho phép"""
+
+class _CpuTimerFired(BaseException):
+    """
+    Raise từ signal handler. Kế thừa BaseException để các khối `except Exception`
+    trong thư viện (vd. trafilatura) không bắt được và chạy tiếp không giới hạn.
+    """
+
+def _raise_cpu_limit(signum, frame):
+    raise _CpuTimerFired()
+
+def _run_with_cpu_limit(func: Callable, cpu_limit: Optional[float], *args) -> Any:
+    """
+    Chạy func trong process con với giới hạn thời gian CPU.
+
+    ITIMER_PROF đếm thời gian CPU (user + system) của process nên thời gian chờ
+    I/O hay bị tranh CPU không bị tính. Quá giới hạn thì timer tiếp tục báo mỗi
+    _CPU_LIMIT_REPEAT giây cho tới khi func dừng hẳn. Nền tảng không có ITIMER_PROF
+    thì chạy không giới hạn.
+    """
+    if not cpu_limit or not hasattr(signal, "ITIMER_PROF"):
+        return func(*args)
+    previous = signal.signal(signal.SIGPROF, _raise_cpu_limit)
+    signal.setitimer(signal.ITIMER_PROF, cpu_limit, _CPU_LIMIT_REPEAT)
+    try:
+        return func(*args)
+    except _CpuTimerFired:
+        pass
+    finally:
+        signal.setitimer(signal.ITIMER_PROF, 0)
+        signal.signal(signal.SIGPROF, previous)
+    # Raise sau khi đã tắt timer; process cha nhận lỗi kế thừa Exception như bình thường
+    raise CpuLimitExceeded("Vượt quá giới hạn thời gian CPU")
+
+class WorkerPool:
+    """
+    Process pool cho các việc nặng CPU (parse HTML...) để không giữ GIL của API worker.
+
+    Pool được tạo lười ở lần dùng đầu tiên. Process con được fork từ forkserver
+    (module chính chỉ import một lần trong forkserver) thay vì fork thẳng process
+    API đang có thread và event loop chạy; nền tảng không có forkserver thì dùng spawn.
+    Pool bị hỏng (process con chết) sẽ được tạo lại ở lần gọi sau.
+    """
+    def __init__(self, max_workers: int = EXTRACTION_WORKERS, cpu_limit: float = EXTRACTION_CPU_LIMIT):
+        self.max_workers = max_workers
+        self.cpu_limit = cpu_limit
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context(
+                    "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+                )
+            )
+        return self._executor
+
+    async def run(self, func: Callable, *args, cpu_limit: Optional[float] = None) -> Any:
+        """Chạy func(*args) trong process con; func phải là hàm cấp module để pickle được"""
+        limit = self.cpu_limit if cpu_limit is None else cpu_limit
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(self._get_executor(), _run_with_cpu_limit, func, limit, *args)
+        except BrokenProcessPool:
+            self._executor = None
+            raise
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+EXTRACTION_POOL = WorkerPool()